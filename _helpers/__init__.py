@@ -1,6 +1,11 @@
 from .weekday import english_day_mapping, persian_day_mapping
 from .singleton import singleton
-from .cache import BaseCacheService
+from .cache import BaseCacheService, AsyncBaseCacheService, BatchResult
+from .cache_stats import CacheStats
+from .local_cache import LocalCache
+from .local_redis import LocalRedis, AsyncLocalRedis, local_script
 from .split import split
 from .datetime import month_range
-from .telegram import get_bot
+from .database import run_in_database_thread
+from .telegram import get_bot, UserOrderedApplication, UserConversationHandler
+from .persistence import PersistenceCacheService, RedisPersistence
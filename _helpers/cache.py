@@ -1,5 +1,39 @@
+import time
+from contextlib import asynccontextmanager, contextmanager
+from django.conf import settings
 from django.core.cache import caches
 from redis import Redis
+from redis.asyncio import ConnectionPool as AsyncConnectionPool, Redis as AsyncRedis
+from redis.client import Pipeline
+from redis.commands.core import Script
+from typing import Union
+from .cache_stats import CacheStats
+from .local_redis import LocalRedis, AsyncLocalRedis
+
+
+class BatchResult:
+    """Value of a read queued inside `BaseCacheService.batch`, available once the batch ran."""
+    _PENDING = object()
+
+    def __init__(self, parser=None):
+        self._parser = parser
+        self._value = self._PENDING
+
+    def resolve(self, response):
+        self._value = self._parser(response) if self._parser else response
+
+    @property
+    def value(self):
+        if self._value is self._PENDING:
+            raise RuntimeError('The batch has not been executed yet')
+
+        return self._value
+
+    @classmethod
+    def resolved(cls, value):
+        result = cls()
+        result.resolve(value)
+        return result
 
 
 class BaseCacheService:
@@ -8,7 +42,182 @@ class BaseCacheService:
 
     }
     EX = 60 * 30
+    _scripts = {}
+
+    def __init__(self):
+        self._pipeline = None
+        self._results = []
 
     @staticmethod
-    def _get_redis_client() -> Redis:
+    def _get_connection() -> Union[Redis, LocalRedis]:
+        if settings.CACHE_SERVICE_BACKEND == 'local':
+            return LocalRedis.get_instance()
+
         return caches['default'].client.get_client()
+
+    def _get_redis_client(self) -> Union[Redis, Pipeline]:
+        """The pipeline of the open batch if there is one, the connection otherwise."""
+        if self._pipeline is not None:
+            return self._pipeline
+
+        return CacheStats.wrap(self._get_connection()) if CacheStats.enabled() else self._get_connection()
+
+    @classmethod
+    def _get_script(cls, source) -> Script:
+        if source not in cls._scripts:
+            cls._scripts[source] = cls._get_connection().register_script(source)
+
+        return cls._scripts[source]
+
+    def _result(self, response, parser=None):
+        """Parses the response of the command just sent through `_get_redis_client`.
+
+        Inside a batch the command was only queued, so a `BatchResult` is returned instead.
+        """
+        if self._pipeline is None:
+            return parser(response) if parser else response
+
+        result = BatchResult(parser)
+        self._results.append((len(self._pipeline.command_stack) - 1, result))
+        return result
+
+    def _constant(self, value):
+        """Answers a read without sending anything, in the shape `_result` would."""
+        return BatchResult.resolved(value) if self._pipeline is not None else value
+
+    def _run_script(self, source, keys, args, parser=None):
+        return self._result(self._get_script(source)(keys=keys, args=args, client=self._get_redis_client()), parser)
+
+    def _send(self, queue):
+        """Runs `queue(pipeline)` on the open batch, or on a pipeline of its own sent right away."""
+        if self._pipeline is not None:
+            queue(self._pipeline)
+            return None
+
+        pipeline = self._get_connection().pipeline(transaction=False)
+        queue(pipeline)
+        return self._execute(pipeline)
+
+    @staticmethod
+    def _execute(pipeline):
+        if not CacheStats.enabled():
+            return pipeline.execute()
+
+        commands = [args for args, _ in pipeline.command_stack]
+        started = time.perf_counter()
+        responses = pipeline.execute()
+        CacheStats.record_pipeline(commands, responses, time.perf_counter() - started)
+        return responses
+
+    def _cache_fields(self, key, **fields):
+        """Sets `fields` of the hash at `key` and restarts its `EX`, in one round trip."""
+        def queue(pipeline):
+            pipeline.hset(key, mapping=fields)
+            pipeline.expire(key, self.EX)
+
+        return self._send(queue)
+
+    @contextmanager
+    def batch(self, transaction=False):
+        """Sends every command issued on this service inside the block in one round trip.
+
+        Reads return a `BatchResult` whose `value` is set when the block exits. Methods
+        that need a read's value to decide what to write can not be used in a batch.
+        """
+        if self._pipeline is not None:
+            yield self
+            return
+
+        self._pipeline = self._get_connection().pipeline(transaction=transaction)
+        self._results = []
+        try:
+            yield self
+            pipeline, results = self._pipeline, self._results
+        finally:
+            self._pipeline = None
+            self._results = []
+
+        responses = self._execute(pipeline)
+        for index, result in results:
+            result.resolve(responses[index])
+
+
+class AsyncBaseCacheService(BaseCacheService):
+    """`BaseCacheService` on an asyncio connection pool, put first in the bases of a cache service.
+
+    Methods return awaitables instead of values, except inside `batch`, which is used
+    with `async with`.
+    """
+    _pool = None
+    _scripts = {}
+
+    @staticmethod
+    def _get_connection() -> Union[AsyncRedis, AsyncLocalRedis]:
+        if settings.CACHE_SERVICE_BACKEND == 'local':
+            return AsyncLocalRedis(LocalRedis.get_instance())
+
+        if AsyncBaseCacheService._pool is None:
+            AsyncBaseCacheService._pool = AsyncConnectionPool.from_url(settings.CACHES['default']['LOCATION'])
+
+        return AsyncRedis(connection_pool=AsyncBaseCacheService._pool)
+
+    @staticmethod
+    async def _parse(response, parser=None):
+        response = await response
+        return parser(response) if parser else response
+
+    def _result(self, response, parser=None):
+        if self._pipeline is None:
+            return self._parse(response, parser)
+
+        return super()._result(response, parser)
+
+    def _constant(self, value):
+        if self._pipeline is None:
+            return self._ready(value)
+
+        return super()._constant(value)
+
+    @staticmethod
+    async def _ready(value):
+        return value
+
+    @staticmethod
+    async def _execute(pipeline):
+        if not CacheStats.enabled():
+            return await pipeline.execute()
+
+        commands = [args for args, _ in pipeline.command_stack]
+        started = time.perf_counter()
+        responses = await pipeline.execute()
+        CacheStats.record_pipeline(commands, responses, time.perf_counter() - started)
+        return responses
+
+    def _run_script(self, source, keys, args, parser=None):
+        script = self._get_script(source)
+        if self._pipeline is None:
+            return self._parse(script(keys=keys, args=args, client=self._get_redis_client()), parser)
+
+        # Calling an async script is a coroutine, queue its EVALSHA on the pipeline instead.
+        self._pipeline.scripts.add(script)
+        self._pipeline.evalsha(script.sha, len(keys), *keys, *args)
+        return super()._result(self._pipeline, parser)
+
+    @asynccontextmanager
+    async def batch(self, transaction=False):
+        if self._pipeline is not None:
+            yield self
+            return
+
+        self._pipeline = self._get_connection().pipeline(transaction=transaction)
+        self._results = []
+        try:
+            yield self
+            pipeline, results = self._pipeline, self._results
+        finally:
+            self._pipeline = None
+            self._results = []
+
+        responses = await self._execute(pipeline)
+        for index, result in results:
+            result.resolve(responses[index])
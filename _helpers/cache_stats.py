@@ -0,0 +1,166 @@
+import inspect
+import logging
+import re
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+
+class CacheStats:
+    """Counts, hits, misses and latency histograms of cache commands, per key family.
+
+    Numbers in keys are folded into `{}`, so `E:42_COURSES` is counted as `E:{}_COURSES`.
+    Records are kept in process and added to the `KEY` hash every `flush_interval` seconds, from
+    a background thread so the event loop of the bot never waits on it.
+    """
+    KEY = 'S:CACHE_STATS'
+    BUCKETS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 1000)
+    READS = {'GET', 'HGET', 'HGETALL', 'MGET'}
+    PIPELINE = 'PIPELINE'
+
+    _counters = defaultdict(int)
+    _flushed = time.monotonic()
+    _lock = Lock()
+    _executor = None
+
+    @staticmethod
+    def enabled() -> bool:
+        return settings.CACHE_STATS['enabled']
+
+    @staticmethod
+    def family(key) -> str:
+        if isinstance(key, bytes):
+            key = key.decode(errors='replace')
+        return re.sub(r'\d+', '{}', str(key)) or '-'
+
+    @classmethod
+    def bucket(cls, elapsed) -> str:
+        milliseconds = elapsed * 1000
+        return next((f'le_{bound}' for bound in cls.BUCKETS if milliseconds <= bound), 'le_inf')
+
+    @staticmethod
+    def _first_key(op, args, kwargs):
+        if op in ('EVAL', 'EVALSHA'):
+            return args[2] if len(args) > 2 and int(args[1]) else ''
+        if op.startswith('SCRIPT'):
+            return ''
+
+        key = kwargs.get('name', kwargs.get('keys', args[0] if args else ''))
+        if isinstance(key, dict):
+            key = next(iter(key), '')
+        if isinstance(key, (list, tuple)):
+            key = key[0] if key else ''
+        return key
+
+    @classmethod
+    def _hits(cls, op, response):
+        if op not in cls.READS:
+            return 0, 0
+        if op == 'MGET':
+            hits = sum(value is not None for value in response)
+            return hits, len(response) - hits
+
+        return (1, 0) if response else (0, 1)
+
+    @classmethod
+    def record(cls, family, op, elapsed=None, hits=0, misses=0):
+        with cls._lock:
+            prefix = f'{family}|{op}|'
+            cls._counters[prefix + 'count'] += 1
+            cls._counters[prefix + 'hits'] += hits
+            cls._counters[prefix + 'misses'] += misses
+            if elapsed is not None:
+                cls._counters[prefix + 'us'] += int(elapsed * 1_000_000)
+                cls._counters[prefix + cls.bucket(elapsed)] += 1
+
+            due = time.monotonic() - cls._flushed >= settings.CACHE_STATS['flush_interval']
+            if due:
+                cls._flushed = time.monotonic()
+
+        if due:
+            cls._flush_in_background()
+
+    @classmethod
+    def _flush_in_background(cls):
+        if cls._executor is None:
+            cls._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='cache-stats')
+
+        cls._executor.submit(cls._flush_quietly)
+
+    @classmethod
+    def _flush_quietly(cls):
+        try:
+            cls.flush()
+        except Exception:
+            logger.exception('Could not flush the cache statistics')
+
+    @classmethod
+    def record_command(cls, op, args, kwargs, response, elapsed):
+        op = op.upper()
+        cls.record(cls.family(cls._first_key(op, args, kwargs)), op, elapsed, *cls._hits(op, response))
+
+    @classmethod
+    def record_pipeline(cls, commands, responses, elapsed):
+        """Records every command of an executed pipeline, along with the whole of it as `PIPELINE`.
+
+        Only the latency of the round trip is known, each command is charged an even share of it,
+        so the latencies of the families sum up to the time actually spent waiting on Redis.
+        """
+        share = elapsed / len(commands) if commands else None
+        for args, response in zip(commands, responses):
+            op = str(args[0]).upper()
+            cls.record(cls.family(cls._first_key(op, args[1:], {})), op, share, *cls._hits(op, response))
+        cls.record(cls.PIPELINE, cls.PIPELINE, elapsed)
+
+    @classmethod
+    def flush(cls):
+        with cls._lock:
+            counters, cls._counters = cls._counters, defaultdict(int)
+            cls._flushed = time.monotonic()
+
+        if not counters:
+            return
+
+        from .cache import BaseCacheService
+
+        pipeline = BaseCacheService._get_connection().pipeline(transaction=False)
+        for field, value in counters.items():
+            if value:
+                pipeline.hincrby(cls.KEY, field, value)
+        pipeline.execute()
+
+    @classmethod
+    def wrap(cls, client):
+        return InstrumentedClient(client)
+
+
+class InstrumentedClient:
+    """Proxy of a Redis connection, sync or asyncio, recording every command it sends to `CacheStats`."""
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if name.startswith('_') or name in ('pipeline', 'register_script') or not callable(attribute):
+            return attribute
+
+        def command(*args, **kwargs):
+            started = time.perf_counter()
+            response = attribute(*args, **kwargs)
+            if not inspect.isawaitable(response):
+                CacheStats.record_command(name, args, kwargs, response, time.perf_counter() - started)
+                return response
+
+            async def awaited():
+                value = await response
+                CacheStats.record_command(name, args, kwargs, value, time.perf_counter() - started)
+                return value
+
+            return awaited()
+
+        return command
@@ -0,0 +1,45 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from functools import partial
+
+_executor = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.DATABASE_WORKERS, thread_name_prefix='database')
+
+    return _executor
+
+
+def _call(function, *args, **kwargs):
+    close_old_connections()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_in_database_thread(function, *args, **kwargs):
+    """Runs `function` on the bounded pool of database threads, keeping the event loop free.
+
+    Querysets are lazy, evaluate them inside `function`.
+    """
+    return await asyncio.get_running_loop().run_in_executor(_get_executor(),
+                                                            partial(_call, function, *args, **kwargs))
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """Sets `SQLITE_PRAGMAS` on every new SQLite connection."""
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
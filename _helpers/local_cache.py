@@ -0,0 +1,41 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class LocalCache:
+    """In-process LRU cache holding at most `max_size` entries, each for `ttl` seconds."""
+    _MISSING = object()
+
+    def __init__(self, max_size=128, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            value, expires = self._entries.get(key, (self._MISSING, 0))
+            if value is self._MISSING:
+                return default
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return default
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
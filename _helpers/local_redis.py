@@ -0,0 +1,408 @@
+import fnmatch
+import hashlib
+import time
+from threading import RLock
+
+
+class LocalScript:
+    """Counterpart of `redis.commands.core.Script`, running a Python function registered with `local_script`."""
+
+    def __init__(self, registered_client, script):
+        self.registered_client = registered_client
+        self.script = script
+        self.sha = hashlib.sha1(script.encode()).hexdigest()
+
+    def __call__(self, keys=None, args=None, client=None):
+        keys, args = keys or [], args or []
+        client = client if client is not None else self.registered_client
+        if hasattr(client, 'scripts'):
+            client.scripts.add(self)
+
+        return client.evalsha(self.sha, len(keys), *keys, *args)
+
+
+class LocalRedis:
+    """In-process stand-in for the subset of Redis the cache services use: strings, bitmaps,
+    hashes, lists and sorted sets with expiry, pipelines and scripts.
+
+    Values are kept and returned as bytes, like redis-py does. Lua scripts have no interpreter
+    here, so each one needs a Python version registered with `local_script`.
+    """
+    SCRIPTS = {}  # SHA1 of the Lua source -> Python version
+    _instance = None
+
+    def __init__(self):
+        self._data = {}
+        self._expires = {}
+        self._lock = RLock()
+
+    @classmethod
+    def get_instance(cls) -> 'LocalRedis':
+        if cls._instance is None:
+            cls._instance = cls()
+
+        return cls._instance
+
+    @staticmethod
+    def _key(key) -> str:
+        return key.decode() if isinstance(key, bytes) else str(key)
+
+    @staticmethod
+    def _encode(value) -> bytes:
+        if isinstance(value, bytes):
+            return value
+        if isinstance(value, float):
+            return repr(value).encode()
+        return str(value).encode()
+
+    def _get(self, key, default=None):
+        key = self._key(key)
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.time():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+
+        return self._data.get(key, default)
+
+    def _put(self, key, value, keep_ttl=True):
+        key = self._key(key)
+        if not keep_ttl:
+            self._expires.pop(key, None)
+        self._data[key] = value
+
+    def _pop_if_empty(self, key):
+        key = self._key(key)
+        if key in self._data and not self._data[key]:
+            del self._data[key]
+            self._expires.pop(key, None)
+
+    # Keys
+
+    def delete(self, *names) -> int:
+        with self._lock:
+            deleted = 0
+            for name in names:
+                if self._get(name) is not None:
+                    deleted += 1
+                    self._data.pop(self._key(name))
+                    self._expires.pop(self._key(name), None)
+            return deleted
+
+    def exists(self, *names) -> int:
+        with self._lock:
+            return sum(self._get(name) is not None for name in names)
+
+    def expire(self, name, time_) -> bool:
+        with self._lock:
+            if self._get(name) is None:
+                return False
+            self._expires[self._key(name)] = time.time() + int(time_)
+            return True
+
+    def ttl(self, name) -> int:
+        with self._lock:
+            if self._get(name) is None:
+                return -2
+            expires = self._expires.get(self._key(name))
+            return -1 if expires is None else max(0, round(expires - time.time()))
+
+    def scan_iter(self, match=None, count=None, _type=None):
+        with self._lock:
+            keys = [key for key in list(self._data) if self._get(key) is not None]
+
+        for key in keys:
+            if match is None or fnmatch.fnmatchcase(key, self._key(match)):
+                yield key.encode()
+
+    def flushdb(self, asynchronous=False) -> bool:
+        with self._lock:
+            self._data.clear()
+            self._expires.clear()
+            return True
+
+    def ping(self) -> bool:
+        return True
+
+    # Strings and bitmaps
+
+    def get(self, name):
+        with self._lock:
+            value = self._get(name)
+            return bytes(value) if value is not None else None
+
+    def set(self, name, value, ex=None, px=None, nx=False, xx=False, keepttl=False) -> bool:
+        with self._lock:
+            exists = self._get(name) is not None
+            if (nx and exists) or (xx and not exists):
+                return None
+
+            self._put(name, bytearray(self._encode(value)), keep_ttl=keepttl)
+            if ex is not None:
+                self._expires[self._key(name)] = time.time() + int(ex)
+            if px is not None:
+                self._expires[self._key(name)] = time.time() + int(px) / 1000
+            return True
+
+    def mget(self, keys, *args) -> list:
+        with self._lock:
+            return [self.get(key) for key in [*(keys if isinstance(keys, (list, tuple)) else [keys]), *args]]
+
+    def mset(self, mapping) -> bool:
+        with self._lock:
+            for name, value in mapping.items():
+                self._put(name, bytearray(self._encode(value)), keep_ttl=False)
+            return True
+
+    def incrby(self, name, amount=1) -> int:
+        with self._lock:
+            value = int(self._get(name, b'0')) + int(amount)
+            self._put(name, bytearray(str(value).encode()))
+            return value
+
+    incr = incrby
+
+    def setbit(self, name, offset, value) -> int:
+        with self._lock:
+            data = self._get(name)
+            if data is None:
+                data = bytearray()
+                self._put(name, data)
+
+            index, mask = offset // 8, 1 << (7 - offset % 8)
+            if len(data) <= index:
+                data.extend(bytes(index + 1 - len(data)))
+            previous = int(bool(data[index] & mask))
+            data[index] = data[index] | mask if value else data[index] & ~mask
+            return previous
+
+    def getbit(self, name, offset) -> int:
+        with self._lock:
+            data = self._get(name) or b''
+            index = offset // 8
+            return int(bool(data[index] & (1 << (7 - offset % 8)))) if index < len(data) else 0
+
+    # Hashes
+
+    def hset(self, name, key=None, value=None, mapping=None, items=None) -> int:
+        with self._lock:
+            fields = dict(mapping or {})
+            if key is not None:
+                fields[key] = value
+            if items:
+                fields.update(zip(items[::2], items[1::2]))
+
+            data = self._get(name)
+            if data is None:
+                data = {}
+                self._put(name, data)
+
+            added = 0
+            for field, field_value in fields.items():
+                field = self._encode(field)
+                added += field not in data
+                data[field] = self._encode(field_value)
+            return added
+
+    def hget(self, name, key):
+        with self._lock:
+            return (self._get(name) or {}).get(self._encode(key))
+
+    def hgetall(self, name) -> dict:
+        with self._lock:
+            return dict(self._get(name) or {})
+
+    def hexists(self, name, key) -> bool:
+        with self._lock:
+            return self._encode(key) in (self._get(name) or {})
+
+    def hdel(self, name, *keys) -> int:
+        with self._lock:
+            data = self._get(name) or {}
+            deleted = sum(data.pop(self._encode(key), None) is not None for key in keys)
+            self._pop_if_empty(name)
+            return deleted
+
+    def hincrby(self, name, key, amount=1) -> int:
+        with self._lock:
+            value = int(self.hget(name, key) or b'0') + int(amount)
+            self.hset(name, key, value)
+            return value
+
+    def hlen(self, name) -> int:
+        with self._lock:
+            return len(self._get(name) or {})
+
+    # Lists
+
+    def _push(self, name, values, left):
+        data = self._get(name)
+        if data is None:
+            data = []
+            self._put(name, data)
+
+        for value in values:
+            data.insert(0, self._encode(value)) if left else data.append(self._encode(value))
+        return len(data)
+
+    def lpush(self, name, *values) -> int:
+        with self._lock:
+            return self._push(name, values, left=True)
+
+    def rpush(self, name, *values) -> int:
+        with self._lock:
+            return self._push(name, values, left=False)
+
+    def lpop(self, name, count=None):
+        with self._lock:
+            data = self._get(name) or []
+            popped = [data.pop(0) for _ in range(min(count or 1, len(data)))]
+            self._pop_if_empty(name)
+            return popped if count is not None else (popped[0] if popped else None)
+
+    def lrange(self, name, start, end) -> list:
+        with self._lock:
+            data = self._get(name) or []
+            return data[start:(end + 1) or None]
+
+    def llen(self, name) -> int:
+        with self._lock:
+            return len(self._get(name) or [])
+
+    # Sorted sets
+
+    def zadd(self, name, mapping) -> int:
+        with self._lock:
+            data = self._get(name)
+            if data is None:
+                data = {}
+                self._put(name, data)
+
+            added = 0
+            for member, score in mapping.items():
+                member = self._encode(member)
+                added += member not in data
+                data[member] = float(score)
+            return added
+
+    def zrem(self, name, *values) -> int:
+        with self._lock:
+            data = self._get(name) or {}
+            removed = sum(data.pop(self._encode(value), None) is not None for value in values)
+            self._pop_if_empty(name)
+            return removed
+
+    def zscore(self, name, value):
+        with self._lock:
+            return (self._get(name) or {}).get(self._encode(value))
+
+    def zcard(self, name) -> int:
+        with self._lock:
+            return len(self._get(name) or {})
+
+    def _sorted(self, name):
+        return sorted((self._get(name) or {}).items(), key=lambda item: (item[1], item[0]))
+
+    def zrange(self, name, start, end, withscores=False) -> list:
+        with self._lock:
+            members = self._sorted(name)[start:(end + 1) or None]
+            return members if withscores else [member for member, _ in members]
+
+    def zrangebyscore(self, name, min, max, start=None, num=None, withscores=False) -> list:
+        with self._lock:
+            members = [(member, score) for member, score in self._sorted(name) if float(min) <= score <= float(max)]
+            if start is not None:
+                members = members[start:start + num if num is not None and num >= 0 else None]
+            return members if withscores else [member for member, _ in members]
+
+    # Scripts and pipelines
+
+    def register_script(self, script) -> LocalScript:
+        return LocalScript(self, script)
+
+    def evalsha(self, sha, numkeys, *keys_and_args):
+        if sha not in self.SCRIPTS:
+            raise NotImplementedError('No Python version of this script is registered with `local_script`')
+
+        # Scripts get their arguments as bytes, like Lua gets strings.
+        with self._lock:
+            return self.SCRIPTS[sha](self,
+                                     [self._key(key) for key in keys_and_args[:numkeys]],
+                                     [self._encode(arg) for arg in keys_and_args[numkeys:]])
+
+    def pipeline(self, transaction=True, shard_hint=None) -> 'LocalPipeline':
+        return LocalPipeline(self)
+
+
+class LocalPipeline:
+    """Queues commands and runs them, holding the store's lock, on `execute`."""
+
+    def __init__(self, client: LocalRedis):
+        self.client = client
+        self.command_stack = []
+        self.scripts = set()
+
+    def __getattr__(self, name):
+        if not callable(getattr(self.client, name, None)) or name.startswith('_'):
+            raise AttributeError(name)
+
+        def command(*args, **kwargs):
+            self.command_stack.append(((name.upper(), *args), kwargs))
+            return self
+
+        return command
+
+    def __len__(self):
+        return len(self.command_stack)
+
+    def execute(self, raise_on_error=True) -> list:
+        with self.client._lock:
+            stack, self.command_stack = self.command_stack, []
+            return [getattr(self.client, args[0].lower())(*args[1:], **options) for args, options in stack]
+
+    def reset(self):
+        self.command_stack = []
+
+
+def local_script(source):
+    """Registers the decorated function as the `LocalRedis` version of the Lua script `source`.
+
+    It is called with the store, the keys and the arguments, while holding the store's lock.
+    """
+    def decorator(function):
+        LocalRedis.SCRIPTS[hashlib.sha1(source.encode()).hexdigest()] = function
+        return function
+
+    return decorator
+
+
+class AsyncLocalRedis:
+    """`LocalRedis` behind the asyncio API, every command resolves right away."""
+
+    def __init__(self, client: LocalRedis):
+        self.client = client
+
+    def __getattr__(self, name):
+        attribute = getattr(self.client, name)
+        if not callable(attribute) or name.startswith('_'):
+            return attribute
+
+        async def command(*args, **kwargs):
+            return attribute(*args, **kwargs)
+
+        return command
+
+    def register_script(self, script) -> 'AsyncLocalScript':
+        return AsyncLocalScript(self, script)
+
+    def pipeline(self, transaction=True, shard_hint=None) -> 'AsyncLocalPipeline':
+        return AsyncLocalPipeline(self.client)
+
+
+class AsyncLocalScript(LocalScript):
+    async def __call__(self, keys=None, args=None, client=None):
+        return await super().__call__(keys, args, client)
+
+
+class AsyncLocalPipeline(LocalPipeline):
+    async def execute(self, raise_on_error=True) -> list:
+        return super().execute(raise_on_error)
@@ -0,0 +1,162 @@
+import asyncio
+import json
+import uuid
+from contextlib import asynccontextmanager
+from telegram.ext import BasePersistence, PersistenceInput
+from .cache import AsyncBaseCacheService
+from .local_redis import local_script
+
+
+class PersistenceCacheService(AsyncBaseCacheService):
+    PREFIX = 'B'
+    KEYS = {
+        'user_data': f'{PREFIX}:{{user_id}}_USER_DATA',
+        'lock': f'{PREFIX}:{{user_id}}_LOCK',
+    }
+    # Deletes the lock KEYS[1] only if it is still held with token ARGV[1], and not by whoever took it after it expired
+    RELEASE_LOCK_SCRIPT = """
+        if redis.call('GET', KEYS[1]) == ARGV[1] then
+            return redis.call('DEL', KEYS[1])
+        end
+        return 0
+    """
+
+    @staticmethod
+    def _loads(response):
+        return json.loads(response) if response is not None else None
+
+    def get_user_data(self, user_id):
+        return self._result(self._get_redis_client().get(self.KEYS['user_data'].format(user_id=user_id)),
+                            self._loads)
+
+    def set_user_data(self, user_id, data, ex):
+        return self._result(self._get_redis_client().set(self.KEYS['user_data'].format(user_id=user_id),
+                                                         json.dumps(data), ex=ex))
+
+    def delete_user_data(self, user_id):
+        return self._result(self._get_redis_client().delete(self.KEYS['user_data'].format(user_id=user_id)))
+
+    def acquire_lock(self, user_id, token, ex):
+        return self._result(self._get_redis_client().set(self.KEYS['lock'].format(user_id=user_id),
+                                                         token, ex=ex, nx=True), bool)
+
+    def release_lock(self, user_id, token):
+        return self._run_script(self.RELEASE_LOCK_SCRIPT, [self.KEYS['lock'].format(user_id=user_id)], [token], bool)
+
+
+@local_script(PersistenceCacheService.RELEASE_LOCK_SCRIPT)
+def _release_lock(client, keys, args):
+    if client.get(keys[0]) != args[0]:
+        return 0
+
+    return client.delete(keys[0])
+
+
+class RedisPersistence(BasePersistence):
+    """Keeps `user_data` in Redis, shared by every bot process, under one key per user that expires
+    `user_data_ttl` seconds after their last update.
+
+    Nothing is loaded on startup, `refresh_user_data` reads the user's data before each update
+    and `UserOrderedApplication` writes it back when the update is done, both while holding the
+    user's `user_lock`. The writes of one `update_persistence` run go in a single pipeline.
+    `user_data` must be JSON serializable, tuples come back as lists.
+
+    Conversations are not persisted, use `UserConversationHandler`, which keeps its state in `user_data`.
+    """
+    LOCK_POLL_INTERVAL = .05
+
+    def __init__(self, update_interval: float = 60, user_data_ttl: int = 60 * 60 * 24 * 30, lock_ttl: int = 30):
+        super().__init__(store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True,
+                                                     callback_data=False),
+                         update_interval=update_interval)
+        self.user_data_ttl = user_data_ttl
+        self.lock_ttl = lock_ttl
+        self._pending = []
+        self._flushing = None
+
+    @asynccontextmanager
+    async def user_lock(self, user_id):
+        """Holds the user's lock in Redis, so only one process at a time handles their updates.
+
+        Waits until the process holding it releases it, or until it expires after `lock_ttl`
+        seconds if that process died. An update taking longer than that is no longer exclusive.
+        """
+        service = PersistenceCacheService()
+        token = uuid.uuid4().hex
+        while not await service.acquire_lock(user_id, token, self.lock_ttl):
+            await asyncio.sleep(self.LOCK_POLL_INTERVAL)
+
+        try:
+            yield
+        finally:
+            await service.release_lock(user_id, token)
+
+    async def _queue(self, method, *args) -> None:
+        self._pending.append((method, args))
+        if self._flushing is None:
+            self._flushing = asyncio.create_task(self._flush_pending())
+
+        await asyncio.shield(self._flushing)
+
+    async def _flush_pending(self) -> None:
+        # `update_persistence` gathers its writes, let all of them queue before sending
+        await asyncio.sleep(0)
+        pending, self._pending, self._flushing = self._pending, [], None
+        if not pending:
+            return
+
+        service = PersistenceCacheService()
+        async with service.batch():
+            for method, args in pending:
+                getattr(service, method)(*args)
+
+    async def get_user_data(self):
+        return {}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        return {}
+
+    async def update_conversation(self, name, key, new_state) -> None:
+        pass
+
+    async def update_user_data(self, user_id, data) -> None:
+        await self._queue('set_user_data', user_id, data, self.user_data_ttl)
+
+    async def drop_user_data(self, user_id) -> None:
+        await self._queue('delete_user_data', user_id)
+
+    async def update_chat_data(self, chat_id, data) -> None:
+        pass
+
+    async def update_bot_data(self, data) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id) -> None:
+        pass
+
+    async def refresh_user_data(self, user_id, user_data) -> None:
+        stored = await PersistenceCacheService().get_user_data(user_id)
+        user_data.clear()
+        user_data.update(stored or {})
+
+    async def refresh_chat_data(self, chat_id, chat_data) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data) -> None:
+        pass
+
+    async def flush(self) -> None:
+        if self._flushing is not None:
+            await asyncio.shield(self._flushing)
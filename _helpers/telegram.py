@@ -1,4 +1,91 @@
-from telegram import Bot
+import asyncio
+from contextlib import asynccontextmanager
+from telegram import Bot, Update
+from telegram.ext import Application, BaseHandler, ConversationHandler
 from secret import BOT_TOKEN
 
 get_bot = lambda: Bot(BOT_TOKEN)
+
+
+class UserOrderedApplication(Application):
+    """Processes updates concurrently, but the updates of each user one after another and in order.
+
+    Keeps conversation states and the per-user cache consistent with concurrent updates. At most
+    `max_concurrent_updates` updates are processed at once, an update waiting for an earlier one of
+    its user does not count, so a user sending many updates at once can't hold up everybody else.
+    Build it with `concurrent_updates(True)`, the limit is `max_concurrent_updates`, given through
+    the `kwargs` of `application_class`.
+    With a `RedisPersistence`, each update is processed and its user's data written back while
+    holding the user's lock in Redis. Across processes the updates of a user are then serialized,
+    but not ordered: two processes holding consecutive updates may process them either way round.
+    """
+
+    def __init__(self, max_concurrent_updates: int = 32, **kwargs):
+        super().__init__(**kwargs)
+        self._updates_semaphore = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._user_locks = {}  # user id -> [lock, number of updates holding or waiting for it]
+
+    @asynccontextmanager
+    async def _user_lock(self, user_id):
+        entry = self._user_locks.setdefault(user_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            # Waiters get the lock in the order they asked for it, the order the updates were fetched in
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._user_locks[user_id]
+
+    async def process_update(self, update: object) -> None:
+        if not isinstance(update, Update) or update.effective_user is None:
+            async with self._updates_semaphore:
+                return await super().process_update(update)
+
+        user_id = update.effective_user.id
+        async with self._user_lock(user_id):
+            if not self.persistence:
+                async with self._updates_semaphore:
+                    return await super().process_update(update)
+
+            async with self.persistence.user_lock(user_id), self._updates_semaphore:
+                await super().process_update(update)
+                await self.update_persistence()
+
+
+class UserConversationHandler(BaseHandler):
+    """`ConversationHandler` of private chats that keeps the user's state in `user_data`, so that it is
+    persisted, and shared between processes, along with the rest of it.
+
+    Callbacks return the next state, `END` to leave the conversation or None to stay in the current
+    state. Like with `ConversationHandler`, `entry_points` are only checked outside the conversation
+    and `fallbacks` after the handlers of the current state.
+    """
+    END = ConversationHandler.END
+    STATE_KEY = 'conversation_state'
+
+    def __init__(self, entry_points, states, fallbacks):
+        super().__init__(self._handle_state)
+        self.entry_points = entry_points
+        self.states = states
+        self.fallbacks = fallbacks
+
+    def check_update(self, update: object) -> bool:
+        return isinstance(update, Update) and update.effective_user is not None
+
+    async def _handle_state(self, update, context):
+        state = context.user_data.get(self.STATE_KEY)
+        handlers = self.entry_points if state is None else [*self.states.get(state, []), *self.fallbacks]
+
+        for handler in handlers:
+            check = handler.check_update(update)
+            if check is None or check is False:
+                continue
+
+            new_state = await handler.handle_update(update, context.application, check, context)
+            if new_state == self.END:
+                context.user_data.pop(self.STATE_KEY, None)
+            elif new_state is not None:
+                context.user_data[self.STATE_KEY] = new_state
+            return
@@ -0,0 +1,199 @@
+import asyncio
+import random
+from unittest import mock
+from django.test import SimpleTestCase, override_settings
+from telegram import Bot, Chat, Message, Update, User
+from telegram.ext import Application, MessageHandler, TypeHandler, filters
+from .cache_stats import CacheStats
+from .local_redis import LocalRedis
+from .persistence import PersistenceCacheService, RedisPersistence
+from .telegram import UserOrderedApplication, UserConversationHandler
+
+TOKEN = '123:ABCdefGhIJKlmnoPQRstuVWXyz123456789'
+
+
+def make_update(update_id, user_id, text='hi'):
+    return Update(update_id, message=Message(update_id, None, Chat(user_id, 'private'),
+                                             from_user=User(user_id, 'user', False), text=text))
+
+
+@mock.patch.object(Bot, 'get_me', mock.AsyncMock(return_value=User(1, 'bot', True, username='bot')))
+class UserOrderedApplicationTest(SimpleTestCase):
+    MAX_CONCURRENT_UPDATES = 2
+
+    def setUp(self):
+        self.events = []
+        self.running = 0
+        self.most_running = 0
+
+    async def _handle(self, update, context):
+        self.running += 1
+        self.most_running = max(self.most_running, self.running)
+        self.events.append(('start', update.effective_user.id, update.update_id))
+        await asyncio.sleep(random.random() / 100 + (.05 if update.effective_user.id == 1 else 0))
+        self.events.append(('end', update.effective_user.id, update.update_id))
+        self.running -= 1
+
+    async def _process(self, updates):
+        application = Application.builder() \
+            .token(TOKEN) \
+            .application_class(UserOrderedApplication, {'max_concurrent_updates': self.MAX_CONCURRENT_UPDATES}) \
+            .concurrent_updates(True) \
+            .build()
+        application.add_handler(TypeHandler(Update, self._handle))
+
+        await application.initialize()
+        await application.start()
+        try:
+            for update in updates:
+                await application.update_queue.put(update)
+            await application.update_queue.join()
+        finally:
+            await application.stop()
+            await application.shutdown()
+
+        return application
+
+    def test_updates_of_each_user_keep_their_order(self):
+        random.seed(0)
+        updates = [make_update(update_id, random.choice([1, 2, 3])) for update_id in range(60)]
+        application = asyncio.run(self._process(updates))
+
+        for user_id in (1, 2, 3):
+            events = [(kind, update_id) for kind, user, update_id in self.events if user == user_id]
+            expected = [update.update_id for update in updates if update.effective_user.id == user_id]
+            self.assertEqual(events, [(kind, update_id) for update_id in expected for kind in ('start', 'end')])
+
+        self.assertLessEqual(self.most_running, self.MAX_CONCURRENT_UPDATES)
+        self.assertEqual(application._user_locks, {})
+
+    def test_waiting_updates_do_not_take_a_slot(self):
+        updates = [make_update(update_id, 1) for update_id in range(10)] + [make_update(10, 2)]
+        asyncio.run(self._process(updates))
+
+        ends = [(user_id, update_id) for kind, user_id, update_id in self.events if kind == 'end']
+        self.assertLess(ends.index((2, 10)), ends.index((1, 9)))
+
+
+@mock.patch.object(Bot, 'get_me', mock.AsyncMock(return_value=User(1, 'bot', True, username='bot')))
+@override_settings(CACHE_SERVICE_BACKEND='local')
+class RedisPersistenceTest(SimpleTestCase):
+    """Two applications sharing the store stand for two bot processes sharing Redis."""
+
+    def setUp(self):
+        LocalRedis._instance = None
+        self.seen = []
+
+    def tearDown(self):
+        LocalRedis._instance = None
+
+    async def _start(self, update, context):
+        context.user_data['catalog'] = (1, 2)
+        return 1
+
+    async def _count(self, update, context):
+        context.user_data['count'] = context.user_data.get('count', 0) + 1
+        self.seen.append((context.application.name, context.user_data['count']))
+        return 2 if context.user_data['count'] == 2 else None
+
+    async def _leave(self, update, context):
+        self.seen.append((context.application.name, 'leave'))
+        return UserConversationHandler.END
+
+    def _build(self, name):
+        application = Application.builder() \
+            .token(TOKEN) \
+            .application_class(UserOrderedApplication) \
+            .concurrent_updates(True) \
+            .persistence(RedisPersistence(user_data_ttl=100)) \
+            .build()
+        application.name = name
+        application.add_handler(UserConversationHandler(
+            entry_points=[MessageHandler(filters.Regex('^start$'), self._start)],
+            states={
+                1: [MessageHandler(filters.Regex('^count$'), self._count)],
+                2: [MessageHandler(filters.Regex('^leave$'), self._leave)],
+            },
+            fallbacks=[],
+        ))
+        return application
+
+    async def _round_trip(self):
+        applications = {name: self._build(name) for name in 'ab'}
+        for application in applications.values():
+            await application.initialize()
+            await application.start()
+
+        try:
+            for update_id, (name, text) in enumerate([('a', 'start'), ('b', 'count'), ('a', 'count'),
+                                                      ('b', 'count'), ('a', 'leave'), ('b', 'count')]):
+                await applications[name].update_queue.put(make_update(update_id, 7, text))
+                await applications[name].update_queue.join()
+        finally:
+            for application in applications.values():
+                await application.stop()
+                await application.shutdown()
+
+        service = PersistenceCacheService()
+        return await service.get_user_data(7), await service._get_connection().ttl('B:7_USER_DATA')
+
+    def test_user_data_and_state_are_shared_between_applications(self):
+        user_data, ttl = asyncio.run(self._round_trip())
+
+        # 'count' in state 2 and after leaving the conversation matches nothing
+        self.assertEqual(self.seen, [('b', 1), ('a', 2), ('a', 'leave')])
+        self.assertEqual(user_data, {'catalog': [1, 2], 'count': 2})
+        self.assertTrue(0 < ttl <= 100)
+
+    def test_lock_is_released_by_its_token_only(self):
+        async def lock():
+            service = PersistenceCacheService()
+            return [await service.acquire_lock(7, 'first', 30),
+                    await service.acquire_lock(7, 'second', 30),
+                    await service.release_lock(7, 'second'),
+                    await service.acquire_lock(7, 'second', 30),
+                    await service.release_lock(7, 'first'),
+                    await service.acquire_lock(7, 'second', 30)]
+
+        self.assertEqual(asyncio.run(lock()), [True, False, False, False, True, True])
+
+    def test_user_lock_waits_for_the_holder(self):
+        async def hold(persistence, name, delay):
+            async with persistence.user_lock(7):
+                self.seen.append(('in', name))
+                await asyncio.sleep(delay)
+                self.seen.append(('out', name))
+
+        async def contend():
+            first, second = RedisPersistence(), RedisPersistence()
+            await asyncio.gather(hold(first, 'a', .1), hold(second, 'b', 0))
+            return await PersistenceCacheService()._get_connection().exists('B:7_LOCK')
+
+        self.assertEqual(asyncio.run(contend()), 0)
+        self.assertEqual(self.seen, [('in', 'a'), ('out', 'a'), ('in', 'b'), ('out', 'b')])
+
+
+@override_settings(CACHE_SERVICE_BACKEND='local', CACHE_STATS={'enabled': True, 'flush_interval': 3600})
+class CacheStatsTest(SimpleTestCase):
+
+    def setUp(self):
+        LocalRedis._instance = None
+        CacheStats.flush()
+
+    def tearDown(self):
+        LocalRedis._instance = None
+
+    def _stats(self):
+        CacheStats.flush()
+        return {field.decode(): int(value)
+                for field, value in LocalRedis.get_instance().hgetall(CacheStats.KEY).items()}
+
+    def test_pipeline_latency_is_shared_by_its_commands(self):
+        CacheStats.record_pipeline([('GET', 'E:1_COURSES'), ('HGET', 'E:2_COURSES', '3'),
+                                    ('SET', 'B:7_USER_DATA', '{}')], [b'1', None, True], .003)
+        stats = self._stats()
+
+        self.assertEqual((stats['E:{}_COURSES|GET|us'], stats['E:{}_COURSES|GET|le_1']), (1000, 1))
+        self.assertEqual((stats['E:{}_COURSES|HGET|us'], stats['E:{}_COURSES|HGET|misses']), (1000, 1))
+        self.assertEqual(stats['B:{}_USER_DATA|SET|us'], 1000)
+        self.assertEqual((stats['PIPELINE|PIPELINE|us'], stats['PIPELINE|PIPELINE|le_5']), (3000, 1))
@@ -1,21 +1,24 @@
 import logging
 import jdatetime
 import datetime
-from django.db.models import Sum
+from typing import Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.constants import ParseMode
 from telegram.ext import Application, CommandHandler, CallbackContext, ConversationHandler, CallbackQueryHandler, \
-    MessageHandler, filters
+    ContextTypes, MessageHandler, filters
 from secret import BOT_TOKEN
-from _helpers import split, month_range
+from _helpers import split, month_range, run_in_database_thread, UserOrderedApplication, \
+    UserConversationHandler, RedisPersistence
 from django.conf import settings
-from prof.models import Student, University, Major
+from django.db import transaction
+from prof.models import Student
 from prof.enums import YearChoices
-from prof.services import NameMappingService
+from prof.services import NameMappingService, ReferenceService, StudentService, StudentIdentity, \
+    AsyncProfileCacheService
 from easy_vahed.models import Chart, Course
-from easy_vahed.services import CacheService, ConflictService
+from easy_vahed.services import AsyncCacheService, ConflictService, CatalogService
 from easy_deadline.models import Exersice
-from easy_deadline.services import DeadlineCacheService
+from easy_deadline.services import AsyncDeadlineCacheService
 
 # Enable logging
 
@@ -26,12 +29,24 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-async def start(update: Update, context: CallbackContext):
-    message = update.message
-    user_id = message.from_user.id
+class StudentContext(CallbackContext):
+    """Resolves the identity of the student sending the update once, for every handler the update reaches."""
+    _UNSET = object()
+
+    def __init__(self, application, chat_id=None, user_id=None):
+        super().__init__(application, chat_id, user_id)
+        self._student = self._UNSET
+
+    async def get_student(self) -> Optional[StudentIdentity]:
+        if self._student is self._UNSET:
+            self._student = await run_in_database_thread(StudentService.get, self._user_id)
+
+        return self._student
+
 
+async def start(update: Update, context: StudentContext):
     is_registered = False
-    if Student.objects.filter(user_id=user_id).exists():
+    if await context.get_student() is not None:
         is_registered = True
 
     if not is_registered:
@@ -48,8 +63,8 @@ async def blind_start(update: Update, _: CallbackContext) -> int:
     name_service: NameMappingService = NameMappingService()
     keyboard = [
         [
-            InlineKeyboardButton(name_service.map_university(university.name), callback_data=university.id)
-        ] for university in University.objects.all()
+            InlineKeyboardButton(name_service.map_university(name), callback_data=university_id)
+        ] for university_id, name in (await run_in_database_thread(ReferenceService.get_universities)).items()
     ]
     markup = InlineKeyboardMarkup(keyboard)
 
@@ -68,15 +83,15 @@ async def register_university(update: Update, _: CallbackContext) -> int:
 
     await query.answer()
 
-    service = CacheService()
-    service.cache_university(user_id=user_id,
-                             university=query.data)
+    service = AsyncCacheService()
+    await service.cache_university(user_id=user_id,
+                                   university=query.data)
     name_service: NameMappingService = NameMappingService()
 
     keyboard = [
         [
-            InlineKeyboardButton(name_service.map_major(major.name), callback_data=major.id)
-        ] for major in Major.objects.all()
+            InlineKeyboardButton(name_service.map_major(name), callback_data=major_id)
+        ] for major_id, name in (await run_in_database_thread(ReferenceService.get_majors)).items()
     ]
     markup = InlineKeyboardMarkup(keyboard)
 
@@ -95,9 +110,9 @@ async def register_major(update: Update, _: CallbackContext) -> int:
 
     await query.answer()
 
-    service = CacheService()
-    service.cache_major(user_id=user_id,
-                        major=query.data)
+    service = AsyncCacheService()
+    await service.cache_major(user_id=user_id,
+                              major=query.data)
 
     keyboard = [
         [
@@ -121,9 +136,9 @@ async def register_done(update: Update, _: CallbackContext) -> int:
 
     await query.answer()
 
-    service = CacheService()
-    university_id = service.get_university(user_id=user_id)
-    major_id = service.get_major(user_id=user_id)
+    service = AsyncCacheService()
+    session = await service.get_session(user_id=user_id)
+    university_id, major_id = session['university'], session['major']
     year = query.data
 
     if university_id == -1 or major_id == -1:
@@ -132,7 +147,8 @@ async def register_done(update: Update, _: CallbackContext) -> int:
         )
         return ConversationHandler.END
 
-    Student.objects.create(
+    await run_in_database_thread(
+        Student.objects.create,
         name=query.from_user.full_name,
         user_id=user_id,
         user_name=query.from_user.username,
@@ -140,6 +156,7 @@ async def register_done(update: Update, _: CallbackContext) -> int:
         major_id=major_id,
         year=year,
     )
+    await AsyncProfileCacheService().delete_profile(user_id=user_id)
 
     await query.edit_message_text(
         settings.TELEGRAM_MESSAGES['register_done'],
@@ -195,56 +212,91 @@ async def easy_vahed(update: Update, _: CallbackContext) -> int:
     return settings.STATES['easy_vahed']
 
 
-async def choose_courses(update: Update, context: CallbackContext) -> int:
+async def choose_courses(update: Update, context: StudentContext) -> int:
     query = update.callback_query
     user_id = query.from_user.id
     selected_course = query.data
 
-    service = CacheService()
-    selected_courses = service.get_courses(user_id=user_id)
+    service = AsyncCacheService()
 
     if selected_course[0] == 'Z':
         await query.answer(text='تداخل داره!')
         return settings.STATES['choose_courses']
 
     await query.answer()
-    if query.data == '-2':
-        service.delete_conflicts_sum(user_id=user_id)
-        service.delete_all_courses(user_id=user_id)
-
-    if selected_course[0] == 'C':
-        if str(selected_course[1:]) in selected_courses:
-            service.delete_courses(user_id, str(selected_course[1:]))
-            service.aggregate_conflicts_minus(user_id=user_id, course_id=int(selected_course[1:]))
-        else:
-            service.cache_course(user_id=user_id, course=selected_course[1:])
-            service.aggregate_conflicts_plus(user_id=user_id, course_id=int(selected_course[1:]))
+    if 'catalog' not in context.user_data:
+        st = await context.get_student()
+        context.user_data['catalog'] = (st.university_id, st.major_id)
+    university_id, major_id = context.user_data['catalog']
 
     if selected_course == '-1':
         return await choose_courses_done(update, context)
 
-    selected_courses = service.get_courses(user_id=user_id)
-    selected_courses_weight_sum = Course.objects.filter(id__in=selected_courses).aggregate(Sum('weight'))['weight__sum']
-    conflicts = service.get_conflicts_sum(user_id=user_id)
-    print(f'course: {selected_course}, confs: {conflicts}')
+    async with service.batch():
+        if query.data == '-2':
+            service.delete_conflicts_sum(user_id=user_id)
+            service.delete_all_courses(user_id=user_id)
+
+        if selected_course[0] == 'C':
+            service.toggle_course(user_id=user_id,
+                                  university_id=university_id,
+                                  major_id=major_id,
+                                  course_id=int(selected_course[1:]))
+
+        selected_courses = service.get_courses(user_id=user_id)
+        conflicts = service.get_conflicts_sum(user_id=user_id)
+        conflicts_version = service.get_conflicts_sum_version(user_id=user_id)
+        version = service.get_catalog_version(university_id=university_id, major_id=major_id)
+
+    catalog = await run_in_database_thread(CatalogService.get_catalog, university_id, major_id,
+                                           version=version.value)
+    selected_courses = set(selected_courses.value)
+    selected_courses_weight_sum = catalog.weight_sum(selected_courses)
+    conflicts = conflicts.value
+
+    # Positions of the sum are those of the catalog it was built for, rebuild it once the catalog moved.
+    if conflicts_version.value != version.value:
+        rows = await service.get_conflict_rows(university_id, major_id,
+                                               [course_id for course_id in map(int, selected_courses)
+                                                if course_id in catalog.positions])
+        conflicts = ConflictService.sum_conflict_rows(rows, len(catalog))
+        await service.init_conflicts_sum(user_id=user_id, conflicts=conflicts, version=version.value)
+
+    page_size = settings.CHOOSE_COURSES_PAGE_SIZE
+    page_count = catalog.page_count(page_size)
+    page = context.user_data.get('courses_page', 0)
+    # The stored page was valid for the catalog version it was shown with, it may not be anymore.
+    same_version = context.user_data.get('courses_page_version') == catalog.version
+    if selected_course[0] == 'P':
+        if int(selected_course[1:]) == page and same_version:
+            return settings.STATES['choose_courses']
+        page = int(selected_course[1:])
+    page = max(0, min(page, page_count - 1))
+    context.user_data['courses_page'] = page
+    context.user_data['courses_page_version'] = catalog.version
 
     selected_emoji = '\U0001F351'
     cross_emoji = '\U0001F480'
-    get_name = lambda course, it: f'{str(course)}{("", f" {selected_emoji}")[str(course.id) in selected_courses]}' \
-                                  f'{(f" {cross_emoji}", "")[not conflicts[it] if conflicts else 1]}'
-    has_conflict = lambda course, it: 1 if (conflicts[it] if conflicts else 0) else 0
-
-    st = Student.objects.get(user_id=user_id)
-    courses = Course.objects.filter(university=st.university,
-                                    majors__in=[st.major])
+    has_conflict = lambda it: 1 if (conflicts[it] if it < len(conflicts) else 0) else 0
+    get_name = lambda course_id, it, label: f'{label}{("", f" {selected_emoji}")[str(course_id) in selected_courses]}' \
+                                            f'{("", f" {cross_emoji}")[has_conflict(it)]}'
 
     keyboard = [
         [
-            InlineKeyboardButton(get_name(course, it),
-                                 callback_data=fr'C{course.id}' if not has_conflict(course, it) else r'Z')
-        ] for it, course in enumerate(courses)
+            InlineKeyboardButton(get_name(course_id, it, label),
+                                 callback_data=fr'C{course_id}' if not has_conflict(it) else r'Z')
+        ] for it, course_id, label in catalog.page(page, page_size)
     ]
 
+    if page_count > 1:
+        keyboard += [
+            [
+                InlineKeyboardButton(label, callback_data=f'P{target}')
+                for label, target in (('«', page - 1), (f'{page + 1}/{page_count}', page), ('»', page + 1))
+                if 0 <= target < page_count
+            ]
+        ]
+
     keyboard += [
         [
             InlineKeyboardButton('ریستارت', callback_data='-2'),
@@ -264,33 +316,54 @@ async def choose_courses(update: Update, context: CallbackContext) -> int:
     return settings.STATES['choose_courses']
 
 
-async def choose_courses_done(update: Update, _: CallbackContext):
+async def choose_courses_done(update: Update, context: CallbackContext):
     query = update.callback_query
     user_id = query.from_user.id
 
-    cache_service = CacheService()
+    cache_service = AsyncCacheService()
     service = ConflictService()
 
-    course_ids = cache_service.get_courses(user_id=user_id)
-    courses = Course.objects.filter(id__in=course_ids)
-
-    for it_1, course_1 in enumerate(courses):
-        for it_2, course_2 in enumerate(courses):
-            if it_2 >= it_1:
-                break
-
-            has_conflict, reason = service.check_conflict(course_1, course_2)
-            if has_conflict:
-                init_message = settings.TELEGRAM_MESSAGES['has_conflict'].format(c1=course_1.name,
-                                                                                 c2=course_2.name,
-                                                                                 reason=reason)
+    university_id, major_id = context.user_data['catalog']
+    async with cache_service.batch():
+        version = cache_service.get_catalog_version(university_id=university_id, major_id=major_id)
+        course_ids = cache_service.get_courses(user_id=user_id)
+    catalog = await run_in_database_thread(CatalogService.get_catalog, university_id, major_id,
+                                           version=version.value)
+    course_ids = course_ids.value
+
+    # Only the rows of the selected courses are read here, the whole catalog's only when a solution is needed.
+    conflict = await run_in_database_thread(service.find_first_catalog_conflict, catalog, course_ids)
+    if conflict:
+        course_id_1, course_id_2, code = conflict
+        rows = await cache_service.get_conflict_rows(university_id, major_id, catalog.ids)
+        init_message = settings.TELEGRAM_MESSAGES['has_conflict'].format(c1=catalog.name(course_id_1),
+                                                                         c2=catalog.name(course_id_2),
+                                                                         reason=service.CONFLICT_CODES[code])
+
+        solutions = await run_in_database_thread(
+            service.find_catalog_solution,
+            catalog,
+            [int(course_id) for course_id in course_ids if int(course_id) != course_id_2],
+            rows,
+            max_weight=settings.COURSE_SOLVER['max_weight'],
+            k=settings.COURSE_SOLVER['top_k'],
+            time_budget=settings.COURSE_SOLVER['time_budget'],
+        )
+        if solutions:
+            solutions_message = '\n'.join([settings.TELEGRAM_MESSAGES['courses_solution_item'].format(
+                courses='، '.join(catalog.label(course_id) for course_id in solution),
+                weight=weight
+            ) for weight, solution in solutions])
+            init_message = f'{init_message}\n' \
+                           f'{settings.TELEGRAM_MESSAGES["courses_solution"].format(c=catalog.name(course_id_2))}\n' \
+                           f'{solutions_message}'
 
-                await query.edit_message_text(
-                    init_message,
-                    parse_mode=ParseMode.MARKDOWN
-                )
+        await query.edit_message_text(
+            init_message,
+            parse_mode=ParseMode.MARKDOWN
+        )
 
-                return ConversationHandler.END
+        return ConversationHandler.END
 
     keyboard = [
         [
@@ -316,16 +389,22 @@ async def choose_courses_done(update: Update, _: CallbackContext):
     return settings.STATES['add_course_to_profile']
 
 
-async def add_course_to_profile(update: Update, _: CallbackContext):
+async def add_course_to_profile(update: Update, context: StudentContext):
     query = update.callback_query
     user_id = query.from_user.id
 
-    service = CacheService()
-    selected_courses = Course.objects.filter(id__in=service.get_courses(user_id=user_id))
-    student = Student.objects.get(user_id=user_id)
+    service = AsyncCacheService()
+    course_ids = await service.get_courses(user_id=user_id)
+    student_id = (await context.get_student()).id
 
-    student.courses.clear()
-    list(map(student.courses.add, selected_courses))
+    def add_courses():
+        with transaction.atomic():
+            student = Student.objects.get(id=student_id)
+            student.courses.clear()
+            student.courses.add(*Course.objects.filter(id__in=course_ids))
+
+    await run_in_database_thread(add_courses)
+    await AsyncProfileCacheService().delete_profile(user_id=user_id)
 
     await query.answer()
 
@@ -347,18 +426,20 @@ async def cancel_adding_courses_to_profile(update: Update, _: CallbackContext):
     return ConversationHandler.END
 
 
-async def download_chart(update: Update, context: CallbackContext):
+async def download_chart(update: Update, context: StudentContext):
     query = update.callback_query
     user_id = query.from_user.id
 
     await query.answer()
+    st = await context.get_student()
 
-    st = Student.objects.get(user_id=user_id)
-    chart = Chart.objects.get(university=st.university,
-                              major=st.major)
+    def get_chart_file():
+        chart = Chart.objects.get(university_id=st.university_id,
+                                  major_id=st.major_id)
+        return chart.file.file
 
     await context.bot.send_document(
-        document=chart.file.file,
+        document=await run_in_database_thread(get_chart_file),
         chat_id=user_id
     )
 
@@ -369,48 +450,36 @@ async def profile(update: Update, _: CallbackContext):
     query = update.callback_query
     user_id = query.from_user.id
 
-    st = Student.objects.get(user_id=user_id)
-    name_service: NameMappingService = NameMappingService()
-
-    init_message = settings.TELEGRAM_MESSAGES['profile'].format(name=st.name,
-                                                                major=name_service.map_major(st.major.name),
-                                                                university=name_service.map_university(
-                                                                    st.university.name),
-                                                                year=name_service.map_year(st.year))
-    courses_message = '\n'.join([settings.TELEGRAM_MESSAGES['profile_courses'].format(
-        name=course.name,
-        prof=course.professor,
-        weight=course.weight
-    ) for course in st.courses.all()])
-
-    sum_course_weight = Course.objects.filter(
-        id__in=st.courses.all().values_list('id')
-    ).aggregate(Sum('weight'))['weight__sum'] or 0
-
-    sum_course_weight_message = settings.TELEGRAM_MESSAGES['sum_weight'].format(sum=sum_course_weight)
+    service = AsyncProfileCacheService()
+    message = await service.get_profile(user_id=user_id)
+    if message is None:
+        message = await run_in_database_thread(StudentService.render_profile, user_id)
+        await service.cache_profile(user_id=user_id, profile=message)
 
     await query.answer()
     await query.edit_message_text(
-        f"{init_message}\n---\n"
-        f"{courses_message}\n---\n"
-        f"{sum_course_weight_message}",
+        message,
         parse_mode=ParseMode.MARKDOWN
     )
 
     return
 
 
-async def easy_deadline(update: Update, _: CallbackContext) -> int:
-    query = update.callback_query
-    user_id = query.from_user.id
-
-    st = Student.objects.get(user_id=user_id)
+async def deadline_courses_markup(context: StudentContext) -> InlineKeyboardMarkup:
+    courses = await run_in_database_thread(StudentService.get_courses, (await context.get_student()).id)
     keyboard = [
         [
             InlineKeyboardButton(str(course), callback_data=course.id)
-        ] for course in st.courses.all()
+        ] for course in courses
     ]
-    markup = InlineKeyboardMarkup(keyboard)
+
+    return InlineKeyboardMarkup(keyboard)
+
+
+async def easy_deadline(update: Update, context: StudentContext) -> int:
+    query = update.callback_query
+
+    markup = await deadline_courses_markup(context)
 
     await query.answer()
     await query.edit_message_text(
@@ -422,61 +491,72 @@ async def easy_deadline(update: Update, _: CallbackContext) -> int:
     return settings.STATES['easy_deadline']
 
 
-async def deadline_course_select(update: Update, context: CallbackContext):
+async def deadline_course_select(update: Update, context: StudentContext):
     query = update.callback_query
     if query:
         user_id = query.from_user.id
     else:
         user_id = update.message.from_user.id
 
-    service = DeadlineCacheService()
+    service = AsyncDeadlineCacheService()
     print('query', query, type(query))
 
     if query:
         if query.data.isdigit():
-            course = Course.objects.get(id=int(query.data))
-            service.cache_course(user_id=user_id,
-                                 course_id=course.id,
-                                 course_name=course.name)
+            course = await run_in_database_thread(Course.objects.get, id=int(query.data))
+            await service.cache_course(user_id=user_id,
+                                       course_id=course.id,
+                                       course_name=course.name)
         else:
             if query.data == 'E0':
                 return await deadline_course_name(update, context)
             elif query.data == 'E1':
                 return await deadline_course_deadline_year(update, context)
             elif query.data == 'E2':
-                if service.get_reminder(user_id=user_id):
-                    service.cache_reminder(user_id=user_id, reminder=0)
-                service.cache_reminder(user_id=user_id, reminder=1)
+                await service.cache_reminder(user_id=user_id, reminder=1)
             else:
                 ...
             await query.answer()
 
-    course_id, course_name = service.get_course(user_id=user_id).split(':')
-    if not course_id:
-        return
+    session = await service.get_session(user_id=user_id)
+
+    # The session expired while the user was filling it, start over from choosing the course.
+    if not session['course']:
+        message = f"{settings.TELEGRAM_MESSAGES['expired']}\n{settings.TELEGRAM_MESSAGES['easy_deadline_main']}"
+        markup = await deadline_courses_markup(context)
+        if query:
+            await query.edit_message_text(message, parse_mode=ParseMode.MARKDOWN, reply_markup=markup)
+        else:
+            await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN, reply_markup=markup)
+
+        return settings.STATES['easy_deadline']
+
+    course_id, course_name = session['course'].split(':', 1)
 
-    cached_name = service.get_name(user_id=user_id)
+    cached_name = session['name']
     name = f'نام تمرین' + (f': {cached_name}', '')[not cached_name]
-    cached_deadline = service.get_deadline(user_id=user_id)
+    cached_deadline = session['deadline']
     deadline = f'ددلاین' + (f': {cached_deadline}', '')[not cached_deadline]
-    cached_reminder = service.get_reminder(user_id=user_id)
+    cached_reminder = session['reminder']
     if cached_reminder == 1:
         cached_reminder = '\U0001F346'
     reminder = f'یادآور' + (f': {cached_reminder}', '')[not cached_reminder]
-    if query.data == 'E-1':
+    if query and query.data == 'E-1':
         if cached_name and cached_deadline and cached_reminder:
             print('++++im here')
 
-            st = Student.objects.get(user_id=user_id)
             year, month, day = list(map(int, cached_deadline.split('-')))
             gr_date = jdatetime.JalaliToGregorian(year, month, day)
 
-            Exersice.objects.create(
-                name=cached_name,
-                course_id=course_id,
-                student=st,
-                deadline=datetime.datetime(gr_date.gyear, gr_date.gmonth, gr_date.gday, 0, 0, 0),
-                has_reminder=(True, False)[not cached_reminder]
+            student = await context.get_student()
+            await run_in_database_thread(
+                lambda: Exersice.objects.create(
+                    name=cached_name,
+                    course_id=course_id,
+                    student_id=student.id,
+                    deadline=datetime.datetime(gr_date.gyear, gr_date.gmonth, gr_date.gday, 0, 0, 0),
+                    has_reminder=(True, False)[not cached_reminder]
+                )
             )
 
             await query.edit_message_text(
@@ -533,9 +613,9 @@ async def deadline_store_course_name(update: Update, context: CallbackContext):
     message = update.message
     user_id = message.from_user.id
 
-    service = DeadlineCacheService()
-    service.cache_name(user_id=user_id,
-                       name=message.text)
+    service = AsyncDeadlineCacheService()
+    await service.cache_name(user_id=user_id,
+                             name=message.text)
 
     return await deadline_course_select(update, context)
 
@@ -565,8 +645,8 @@ async def deadline_course_deadline_month(update: Update, _: CallbackContext):
     user_id = query.from_user.id
     await query.answer()
 
-    service = DeadlineCacheService()
-    service.cache_deadline(
+    service = AsyncDeadlineCacheService()
+    await service.cache_deadline(
         user_id=user_id,
         deadline=query.data
     )
@@ -593,13 +673,13 @@ async def deadline_course_deadline_day(update: Update, _: CallbackContext):
     user_id = query.from_user.id
 
     await query.answer()
-    service = DeadlineCacheService()
-    year = service.get_deadline(
+    service = AsyncDeadlineCacheService()
+    year = await service.get_deadline(
         user_id=user_id
     )
     month = query.data
 
-    service.cache_deadline(
+    await service.cache_deadline(
         user_id=user_id,
         deadline=f'{year}-{month}'
     )
@@ -624,12 +704,12 @@ async def deadline_course_deadline_done(update: Update, _: CallbackContext):
     user_id = query.from_user.id
 
     await query.answer()
-    service = DeadlineCacheService()
-    year_month = service.get_deadline(
+    service = AsyncDeadlineCacheService()
+    year_month = await service.get_deadline(
         user_id=user_id
     )
     day = query.data
-    service.cache_deadline(
+    await service.cache_deadline(
         user_id=user_id,
         deadline=f'{year_month}-{day}'
     )
@@ -637,12 +717,18 @@ async def deadline_course_deadline_done(update: Update, _: CallbackContext):
     return await deadline_course_select(update, _)
 
 
-def main() -> None:
-    """Start the bot."""
+def build_application() -> Application:
+    """The bot's application with every handler registered, shared by polling and webhook mode."""
 
-    application = Application.builder().token(BOT_TOKEN).build()
+    application = Application.builder() \
+        .token(BOT_TOKEN) \
+        .application_class(UserOrderedApplication, {'max_concurrent_updates': settings.BOT_CONCURRENT_UPDATES}) \
+        .concurrent_updates(True) \
+        .persistence(RedisPersistence(**settings.BOT_PERSISTENCE)) \
+        .context_types(ContextTypes(context=StudentContext)) \
+        .build()
 
-    application.add_handler(ConversationHandler(
+    application.add_handler(UserConversationHandler(
         entry_points=[CommandHandler('start', start)],
         states={
             settings.STATES['register_university']: [
@@ -686,9 +772,16 @@ def main() -> None:
                 CallbackQueryHandler(deadline_course_deadline_done, pattern='^\d+$')
             ]
         },
-        fallbacks=[CommandHandler('start', start)]
+        fallbacks=[CommandHandler('start', start)],
     ))
-    application.run_polling()
+
+    return application
+
+
+def main() -> None:
+    """Start the bot."""
+
+    build_application().run_polling()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.13 on 2026-10-18 16:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('easy_deadline', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='exersice',
+            index=models.Index(fields=['deadline'], name='exersice_deadline_idx'),
+        ),
+    ]
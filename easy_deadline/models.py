@@ -13,3 +13,8 @@ class Exersice(models.Model):
     deadline = models.DateTimeField()
     has_reminder = models.BooleanField(default=False)
     objects = ExersiceManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deadline'], name='exersice_deadline_idx'),
+        ]
@@ -1 +1 @@
-from .deadline import DeadlineCacheService
+from .deadline import DeadlineCacheService, AsyncDeadlineCacheService
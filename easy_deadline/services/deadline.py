@@ -1,68 +1,76 @@
-from _helpers import BaseCacheService
+from _helpers import BaseCacheService, AsyncBaseCacheService
 
 
 class DeadlineCacheService(BaseCacheService):
     PREFIX = 'ED'
     KEYS = {
-        'course': f'{PREFIX}:''{user_id}_COURSE',
-        'name': f'{PREFIX}:''{user_id}_NAME',
-        'deadline': f'{PREFIX}:''{user_id}_DEADLINE',
-        'reminder': f'{PREFIX}:''{user_id}_REMINDER',
+        'session': f'{PREFIX}:''{user_id}_SESSION',
         'sent_pm': f'{PREFIX}:''{exercise_id}_SENT_PM',
     }
     EX = 60 * 15
 
-    def cache_course(self, user_id, course_id, course_name):
+    @staticmethod
+    def _parse_session(session) -> dict:
+        return {
+            'course': session.get(b'course', b'').decode(),
+            'name': session.get(b'name', b'').decode(),
+            'deadline': session.get(b'deadline', b'').decode(),
+            'reminder': int(session.get(b'reminder', b'0').decode()),
+        }
+
+    def get_session(self, user_id) -> dict:
+        """The deadline being drafted by the user, kept in one hash expiring `EX` after its last change."""
         client = self._get_redis_client()
 
-        client.set(name=self.KEYS['course'].format(user_id=user_id),
-                   value=f'{course_id}:{course_name}')
+        return self._result(client.hgetall(self.KEYS['session'].format(user_id=user_id)),
+                            self._parse_session)
 
-    def get_course(self, user_id) -> str:
+    def _get_session_field(self, user_id, field):
         client = self._get_redis_client()
 
-        return (client.get(name=self.KEYS['course'].format(user_id=user_id)) or b'').decode()
+        return self._result(client.hget(self.KEYS['session'].format(user_id=user_id), field),
+                            lambda value: self._parse_session({field.encode(): value} if value is not None else {})[field])
 
-    def cache_name(self, user_id, name):
-        client = self._get_redis_client()
+    def cache_course(self, user_id, course_id, course_name):
+        return self._cache_fields(self.KEYS['session'].format(user_id=user_id),
+                                  course=f'{course_id}:{course_name}')
 
-        client.set(name=self.KEYS['name'].format(user_id=user_id),
-                   value=name)
+    def get_course(self, user_id) -> str:
+        return self._get_session_field(user_id, 'course')
 
-    def get_name(self, user_id) -> str:
-        client = self._get_redis_client()
+    def cache_name(self, user_id, name):
+        return self._cache_fields(self.KEYS['session'].format(user_id=user_id),
+                                  name=name)
 
-        return (client.get(name=self.KEYS['name'].format(user_id=user_id)) or b'').decode()
+    def get_name(self, user_id) -> str:
+        return self._get_session_field(user_id, 'name')
 
     def cache_deadline(self, user_id, deadline):
-        client = self._get_redis_client()
-
-        client.set(name=self.KEYS['deadline'].format(user_id=user_id),
-                   value=deadline)
+        return self._cache_fields(self.KEYS['session'].format(user_id=user_id),
+                                  deadline=deadline)
 
     def get_deadline(self, user_id) -> str:
-        client = self._get_redis_client()
-
-        return (client.get(name=self.KEYS['deadline'].format(user_id=user_id)) or b'').decode()
+        return self._get_session_field(user_id, 'deadline')
 
     def cache_reminder(self, user_id, reminder):
-        client = self._get_redis_client()
-
-        client.set(name=self.KEYS['reminder'].format(user_id=user_id),
-                   value=reminder)
+        return self._cache_fields(self.KEYS['session'].format(user_id=user_id),
+                                  reminder=reminder)
 
     def get_reminder(self, user_id) -> int:
-        client = self._get_redis_client()
-
-        return int((client.get(name=self.KEYS['reminder'].format(user_id=user_id)) or b'0').decode())
+        return self._get_session_field(user_id, 'reminder')
 
     def cache_sent_pm(self, exercise_id):
         client = self._get_redis_client()
 
-        client.set(self.KEYS['sent_pm'].format(exercise_id=exercise_id),
-                   1)
+        return self._result(client.set(self.KEYS['sent_pm'].format(exercise_id=exercise_id),
+                                       1))
 
     def get_sent_pm(self, exercise_id):
         client = self._get_redis_client()
 
-        return int((client.get(self.KEYS['sent_pm'].format(exercise_id=exercise_id)) or b'0').decode())
+        return self._result(client.get(self.KEYS['sent_pm'].format(exercise_id=exercise_id)),
+                            lambda sent_pm: int((sent_pm or b'0').decode()))
+
+
+class AsyncDeadlineCacheService(AsyncBaseCacheService, DeadlineCacheService):
+    """`DeadlineCacheService` for the bot's handlers, every method is awaited outside a batch."""
@@ -12,8 +12,12 @@ async def send_all_pms(exercises: List[Exersice]):
 
 
 def send_pm():
-    exercises = Exersice.objects.remained()
+    exercises = list(Exersice.objects.remained())
     service = DeadlineCacheService()
-    for exercise in exercises:
-        if not service.get_sent_pm(exercise_id=exercise.id):
-            service.cache_sent_pm(exercise_id=exercise.id)
+    with service.batch():
+        sent_pms = [service.get_sent_pm(exercise_id=exercise.id) for exercise in exercises]
+
+    with service.batch():
+        for exercise, sent_pm in zip(exercises, sent_pms):
+            if not sent_pm.value:
+                service.cache_sent_pm(exercise_id=exercise.id)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class EasyVahedConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'easy_vahed'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -8,6 +8,5 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         os.environ['DJANGO_SETTINGS_MODULE'] = 'uniar_bot.settings'
-        os.environ["DJANGO_ALLOW_ASYNC_UNSAFE"] = "true"
 
         main()
@@ -0,0 +1,55 @@
+from collections import defaultdict
+from django.core.management.base import BaseCommand
+from _helpers import BaseCacheService, CacheStats
+
+
+class Command(BaseCommand):
+    help = 'This command dumps the recorded cache statistics and the key count of every key family!'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keys', action='store_true', help='Also SCAN the keyspace and count keys per family')
+        parser.add_argument('--reset', action='store_true', help='Delete the recorded statistics afterwards')
+
+    def handle(self, *args, **options):
+        CacheStats.flush()
+        client = BaseCacheService._get_connection()
+
+        stats = defaultdict(lambda: defaultdict(int))
+        for field, value in client.hgetall(CacheStats.KEY).items():
+            family, op, metric = field.decode().rsplit('|', 2)
+            stats[family, op][metric] = int(value)
+
+        for (family, op), metrics in sorted(stats.items(), key=lambda item: -item[1]['count']):
+            line = f'{family} {op} count={metrics["count"]}'
+            if metrics['hits'] or metrics['misses']:
+                line += f' hit={metrics["hits"] / (metrics["hits"] + metrics["misses"]):.1%}'
+
+            timed = sum(metrics[f'le_{bound}'] for bound in CacheStats.BUCKETS) + metrics['le_inf']
+            if timed:
+                line += f' avg={metrics["us"] / timed / 1000:.2f}ms' \
+                        f' p50<={self._quantile(metrics, timed, .5)}' \
+                        f' p95<={self._quantile(metrics, timed, .95)}' \
+                        f' p99<={self._quantile(metrics, timed, .99)}'
+            self.stdout.write(line)
+
+        if options['keys']:
+            families = defaultdict(int)
+            for key in client.scan_iter(count=1000):
+                families[CacheStats.family(key)] += 1
+
+            for family, count in sorted(families.items(), key=lambda item: -item[1]):
+                self.stdout.write(f'{family} keys={count}')
+            self.stdout.write(f'{sum(families.values())} keys in {len(families)} families!')
+
+        if options['reset']:
+            client.delete(CacheStats.KEY)
+
+    @staticmethod
+    def _quantile(metrics, timed, quantile) -> str:
+        seen = 0
+        for bound in CacheStats.BUCKETS:
+            seen += metrics[f'le_{bound}']
+            if seen >= quantile * timed:
+                return f'{bound}ms'
+
+        return 'inf'
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from easy_deadline.models import Exersice
+from easy_vahed.models import Course
+from easy_vahed.services import ConflictService
+from prof.models import Student
+
+
+class Command(BaseCommand):
+    help = 'This command explains the hot queries of the bot and fails if one of them does not use its index!'
+
+    # Label -> (queryset, [(table, leading columns of the index it should use), ...])
+    @staticmethod
+    def _queries():
+        return {
+            'student by user id': (Student.objects.filter(user_id='0'),
+                                   [('prof_student', ['user_id'])]),
+            'catalog courses': (ConflictService.get_catalog_courses(0, 0),
+                                [('easy_vahed_course', ['university_id']),
+                                 ('easy_vahed_course_majors', ['course_id'])]),
+            'catalogs of a course': (Course.majors.through.objects.filter(course_id=0),
+                                     [('easy_vahed_course_majors', ['course_id'])]),
+            'remained exercises': (Exersice.objects.remained(),
+                                   [('easy_deadline_exersice', ['deadline'])]),
+        }
+
+    @staticmethod
+    def _index_names(table, columns):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, table)
+
+        return {name for name, constraint in constraints.items()
+                if constraint['index'] and constraint['columns'][:len(columns)] == columns}
+
+    def handle(self, *args, **options):
+        failed = []
+        for label, (queryset, expected) in self._queries().items():
+            plan = queryset.explain()
+            self.stdout.write(f'{label}:\n{plan}')
+
+            for table, columns in expected:
+                names = self._index_names(table, columns)
+                if not any(name in plan for name in names):
+                    failed.append(f'{label} does not use an index on {table}({", ".join(columns)})')
+
+        if failed:
+            raise CommandError('\n'.join(failed))
+
+        self.stdout.write('Every hot query uses its index!')
@@ -1,17 +1,70 @@
+import os
+import time
+import django
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from django.core.management.base import BaseCommand
+from django.db import connections
 from prof.models import Major, University
-from easy_vahed.models import Course
-from easy_vahed.services import ConflictService
+from easy_vahed.services import CacheService, ConflictService, ConflictMatrixService
 
 
 class Command(BaseCommand):
-    help = 'This command preprocesses conflicts!'
+    help = 'This command preprocesses conflicts of every university and major!'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--university', help='Only preprocess this university')
+        parser.add_argument('--major', help='Only preprocess this major')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Size of the process pool computing the matrices')
 
     def handle(self, *args, **options):
-        major = Major.objects.get(name='cs')
-        university = University.objects.get(name='aut')
+        catalogs = ConflictService.get_catalogs()
+        if options['university']:
+            university = University.objects.get(name=options['university'])
+            catalogs = [catalog for catalog in catalogs if catalog[0] == university.id]
+        if options['major']:
+            major = Major.objects.get(name=options['major'])
+            catalogs = [catalog for catalog in catalogs if catalog[1] == major.id]
+
+        loaded = {}
+        load_times = {}
+        for university_id, major_id in catalogs:
+            started = time.perf_counter()
+            loaded[university_id, major_id] = ConflictMatrixService.load_catalog(
+                ConflictService.get_catalog_courses(university_id, major_id)
+            )
+            load_times[university_id, major_id] = time.perf_counter() - started
+
+        # Workers only run NumPy, the connections must not leak into forked children.
+        connections.close_all()
+        cache_service = CacheService()
+
+        with ProcessPoolExecutor(max_workers=max(1, min(options['workers'], len(catalogs) or 1)),
+                                 initializer=django.setup) as executor:
+            futures = {
+                executor.submit(_compute, catalog): key
+                for key, catalog in loaded.items()
+            }
+
+            for future in as_completed(futures):
+                university_id, major_id = key = futures[future]
+                matrix, reasons, compute_time = future.result()
+
+                started = time.perf_counter()
+                cache_service.cache_conflict_matrix(university_id, major_id,
+                                                    loaded[key].ids.tolist(), matrix, reasons)
+                write_time = time.perf_counter() - started
+
+                self.stdout.write(f'university={university_id} major={major_id} courses={len(loaded[key])} '
+                                  f'load={load_times[key]:.3f}s compute={compute_time:.3f}s '
+                                  f'write={write_time:.3f}s')
+
+        self.stdout.write(f'{len(catalogs)} catalogs preprocessed!')
+
+
+def _compute(catalog):
+    started = time.perf_counter()
+    reasons = ConflictMatrixService.reason_matrix(catalog)
+    matrix = ConflictMatrixService.conflict_matrix(catalog, reasons)
 
-        courses = Course.objects.filter(university=university,
-                                        majors__in=[major])
-        service = ConflictService()
-        service.preprocess_conflicts(courses)
+    return matrix, reasons, time.perf_counter() - started
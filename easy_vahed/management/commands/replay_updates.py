@@ -0,0 +1,39 @@
+import json
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'This command replays Telegram updates from a JSON file into the webhook!'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='A JSON list of updates, or one update per line')
+        parser.add_argument('--url', default=f'http://127.0.0.1:8000{settings.TELEGRAM_WEBHOOK["path"]}',
+                            help='Webhook to post the updates to')
+
+    def handle(self, *args, **options):
+        with open(options['file'], encoding='utf-8') as f:
+            content = f.read().strip()
+
+        if content.startswith('['):
+            updates = json.loads(content)
+        else:
+            updates = [json.loads(line) for line in content.splitlines() if line.strip()]
+
+        headers = {'Content-Type': 'application/json'}
+        if settings.TELEGRAM_WEBHOOK['secret_token']:
+            headers['X-Telegram-Bot-Api-Secret-Token'] = settings.TELEGRAM_WEBHOOK['secret_token']
+
+        for update in updates:
+            request = Request(options['url'], data=json.dumps(update).encode(), headers=headers, method='POST')
+            try:
+                with urlopen(request) as response:
+                    status = response.status
+            except HTTPError as e:
+                raise CommandError(f'Update {update.get("update_id")} was refused with {e.code}!')
+
+            self.stdout.write(f'update={update.get("update_id")} status={status}')
+
+        self.stdout.write(f'{len(updates)} updates replayed!')
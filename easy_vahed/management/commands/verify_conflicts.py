@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from prof.models import Major, University
+from easy_vahed.services import ConflictService
+
+
+class Command(BaseCommand):
+    help = 'This command cross-checks the conflict matrix against pairwise conflict checks!'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--university', default='aut')
+        parser.add_argument('--major', default='cs')
+
+    def handle(self, *args, **options):
+        major = Major.objects.get(name=options['major'])
+        university = University.objects.get(name=options['university'])
+
+        courses = ConflictService.get_catalog_courses(university.id, major.id)
+        mismatches = ConflictService.cross_check(courses)
+
+        for course_1, course_2, expected, actual in mismatches:
+            self.stderr.write(f'{course_1.id} x {course_2.id}: expected {expected}, got {actual}')
+
+        if mismatches:
+            raise CommandError(f'{len(mismatches)} mismatching pairs!')
+        self.stdout.write(f'Conflict matrix matches for {courses.count()} courses!')
@@ -1,2 +1,4 @@
-from .cache import CacheService
+from .cache import CacheService, AsyncCacheService
 from .conflict import ConflictService
+from .matrix import ConflictMatrixService
+from .catalog import CatalogService
@@ -1,151 +1,437 @@
-from _helpers import BaseCacheService
+import numpy as np
+from collections import defaultdict
+from _helpers import BaseCacheService, AsyncBaseCacheService, local_script
 from django.utils import timezone
-from typing import List
+from typing import List, Optional, Tuple
 
 
 class CacheService(BaseCacheService):
     PREFIX = 'E'
     KEYS = {
-        'university': f'{PREFIX}:''{user_id}_UNIVERSITY',
-        'major': f'{PREFIX}:''{user_id}_MAJOR',
+        'session': f'{PREFIX}:''{user_id}_SESSION',
         'course': f'{PREFIX}:''{user_id}_COURSES',
-        'conflicts': f'{PREFIX}:''{course_id}_CONFLICTS',
+        'course_expiry': f'{PREFIX}:COURSES_EXPIRY',
+        'conflicts': f'{PREFIX}:''{university_id}_{major_id}_{course_id}_CONFLICTS',
+        'conflict_reasons': f'{PREFIX}:''{university_id}_{major_id}_{course_id}_CONFLICT_REASONS',
         'conflicts_sum': f'{PREFIX}:''{user_id}_CONFLICTS_SUM',
+        'conflicts_sum_version': f'{PREFIX}:''{user_id}_CONFLICTS_SUM_VERSION',
+        'catalog_version': f'{PREFIX}:''{university_id}_{major_id}_CATALOG_VERSION',
     }
     EX = 60 * 30
 
-    def cache_university(self, user_id, university):
+    # Conflict rows are bitmaps, bit `i` (in Redis' GETBIT order) being the `i`th course of the catalog.
+    # Reason rows use the same layout, a set bit meaning the class times clash (code 1) and an unset one
+    # meaning the exams do (code 0). They only matter where the conflict bit is set.
+    # Conflict sums hold one big-endian unsigned 16-bit counter per course. They are only valid for the
+    # catalog version they were built for, see `init_conflicts_sum`.
+    SUM_DTYPE = np.dtype('>u2')
+
+    # Adds (sign = 1) or subtracts (sign = -1) a conflict row to a user's conflict sum.
+    _ADD_CONFLICTS = """
+        local function add_conflicts(conflicts_key, sum_key, sign)
+            local conflicts = redis.call('GET', conflicts_key)
+            if not conflicts then
+                return 0
+            end
+
+            local current = redis.call('GET', sum_key) or ''
+            local result = {}
+            for j = 1, #conflicts do
+                local byte = string.byte(conflicts, j)
+                for k = 0, 7 do
+                    local i = (j - 1) * 8 + k
+                    local high, low = string.byte(current, 2 * i + 1, 2 * i + 2)
+                    local value = (high or 0) * 256 + (low or 0)
+                    if math.floor(byte / 2 ^ (7 - k)) % 2 == 1 then
+                        value = math.min(math.max(value + sign, 0), 65535)
+                    end
+                    result[i + 1] = string.char(math.floor(value / 256), value % 256)
+                end
+            end
+
+            redis.call('SET', sum_key, table.concat(result))
+            return #result
+        end
+    """
+    AGGREGATE_CONFLICTS_SCRIPT = _ADD_CONFLICTS + """
+        return add_conflicts(KEYS[1], KEYS[2], tonumber(ARGV[1]))
+    """
+    # Selects the course if it is not selected yet and deselects it otherwise, keeping the
+    # conflict sum and the expiry index in step. Returns 1 if the course ended up selected.
+    TOGGLE_COURSE_SCRIPT = _ADD_CONFLICTS + """
+        if redis.call('HEXISTS', KEYS[3], ARGV[1]) == 1 then
+            redis.call('HDEL', KEYS[3], ARGV[1])
+            redis.call('ZREM', KEYS[4], ARGV[3])
+            add_conflicts(KEYS[1], KEYS[2], -1)
+            return 0
+        end
+
+        redis.call('HSET', KEYS[3], ARGV[1], ARGV[2])
+        redis.call('ZADD', KEYS[4], ARGV[2], ARGV[3])
+        add_conflicts(KEYS[1], KEYS[2], 1)
+        return 1
+    """
+    # Deselects the courses ARGV[3..] of user ARGV[2] that are still selected at or before ARGV[1] in the
+    # expiry index. The conflict sum is dropped along with its version, so it is rebuilt on the next read.
+    # Returns the number of entries removed from the index.
+    DELETE_EXPIRED_COURSES_SCRIPT = """
+        local removed = 0
+        for i = 3, #ARGV do
+            local member = ARGV[2] .. ':' .. ARGV[i]
+            local score = redis.call('ZSCORE', KEYS[1], member)
+            if score and tonumber(score) <= tonumber(ARGV[1]) then
+                redis.call('HDEL', KEYS[2], ARGV[i])
+                redis.call('ZREM', KEYS[1], member)
+                removed = removed + 1
+            end
+        end
+
+        if removed > 0 then
+            redis.call('DEL', KEYS[3], KEYS[4])
+        end
+        return removed
+    """
+    EXPIRED_COURSES_BATCH = 1000
+
+    def get_session(self, user_id) -> dict:
+        """Registration of the user, kept in one hash expiring `EX` after its last change."""
         client = self._get_redis_client()
 
-        client.set(name=self.KEYS['university'].format(user_id=user_id),
-                   value=university,
-                   ex=self.EX)
+        return self._result(client.hgetall(self.KEYS['session'].format(user_id=user_id)),
+                            lambda session: {'university': int(session.get(b'university', b'-1')),
+                                             'major': int(session.get(b'major', b'-1'))})
+
+    def cache_university(self, user_id, university):
+        return self._cache_fields(self.KEYS['session'].format(user_id=user_id), university=university)
 
     def get_university(self, user_id) -> int:
         client = self._get_redis_client()
 
-        return int(client.get(name=self.KEYS['university'].format(user_id=user_id)) or b'-1')
+        return self._result(client.hget(self.KEYS['session'].format(user_id=user_id), 'university'),
+                            lambda university: int(university or b'-1'))
 
     def cache_major(self, user_id, major):
-        client = self._get_redis_client()
-
-        client.set(name=self.KEYS['major'].format(user_id=user_id),
-                   value=major,
-                   ex=self.EX)
+        return self._cache_fields(self.KEYS['session'].format(user_id=user_id), major=major)
 
     def get_major(self, user_id) -> int:
         client = self._get_redis_client()
 
-        return int(client.get(name=self.KEYS['major'].format(user_id=user_id)) or b'-1')
+        return self._result(client.hget(self.KEYS['session'].format(user_id=user_id), 'major'),
+                            lambda major: int(major or b'-1'))
+
+    @staticmethod
+    def _expiry_member(user_id, course):
+        return f'{user_id}:{course}'
 
     def cache_course(self, user_id, course):
-        client = self._get_redis_client()
+        now = timezone.now().timestamp()
+
+        def queue(pipeline):
+            pipeline.hset(name=self.KEYS['course'].format(user_id=user_id),
+                          key=course,
+                          value=now)
+            pipeline.zadd(self.KEYS['course_expiry'], {self._expiry_member(user_id, course): now})
 
-        client.hset(name=self.KEYS['course'].format(user_id=user_id),
-                    key=course,
-                    value=timezone.now().timestamp())
+        return self._send(queue)
 
     def get_courses(self, user_id):
         client = self._get_redis_client()
 
-        return [c.decode() for c in client.hgetall(name=self.KEYS['course'].format(user_id=user_id))]
+        return self._result(client.hgetall(name=self.KEYS['course'].format(user_id=user_id)),
+                            lambda courses: [c.decode() for c in courses])
 
     def get_course_created(self, user_id, course):
         client = self._get_redis_client()
 
-        return float(client.hget(name=self.KEYS['course'].format(user_id=user_id), key=course).decode())
+        return self._result(client.hget(name=self.KEYS['course'].format(user_id=user_id), key=course),
+                            lambda created: float(created.decode()))
 
     def delete_courses(self, user_id, *courses):
-        if not courses:
-            return
+        def queue(pipeline):
+            if not courses:
+                return
 
-        client = self._get_redis_client()
-        client.hdel(self.KEYS['course'].format(user_id=user_id),
-                    *courses)
+            pipeline.hdel(self.KEYS['course'].format(user_id=user_id),
+                          *courses)
+            pipeline.zrem(self.KEYS['course_expiry'],
+                          *[self._expiry_member(user_id, course.decode() if isinstance(course, bytes) else course)
+                            for course in courses])
+
+        return self._send(queue)
 
     def delete_all_courses(self, user_id):
+        # Entries left in the expiry index are dropped by `delete_expired_courses`, deleting
+        # a field that is already gone is a no-op.
         client = self._get_redis_client()
 
-        client.delete(self.KEYS['course'].format(user_id=user_id))
+        return self._result(client.delete(self.KEYS['course'].format(user_id=user_id)))
 
-    def delete_non_used_courses(self, user_id):
+    def _non_used_courses(self, courses):
         now = timezone.now().timestamp()
-        courses = [course for course in self.get_courses(user_id=user_id)
-                   if now - self.get_course_created(user_id=user_id, course=course) >= self.EX]
+        return [course for course, created in courses.items() if now - float(created) >= self.EX]
 
-        self.delete_courses(user_id, *courses)
-
-    def cache_conflicts(self, course_id, *courses):
+    def delete_non_used_courses(self, user_id):
         client = self._get_redis_client()
 
-        client.rpush(self.KEYS['conflicts'].format(course_id=course_id), *courses)
+        courses = client.hgetall(self.KEYS['course'].format(user_id=user_id))
+        self.delete_courses(user_id, *self._non_used_courses(courses))
 
-    def get_conflicts(self, course_id) -> List[int]:
+    def _get_expired_members(self, cutoff):
         client = self._get_redis_client()
 
-        return list(map(lambda x: int(x.decode()),
-                        client.lrange(name=self.KEYS['conflicts'].format(course_id=course_id), start=0, end=127)))
+        return self._result(client.zrangebyscore(self.KEYS['course_expiry'], '-inf', cutoff,
+                                                 start=0, num=self.EXPIRED_COURSES_BATCH))
+
+    @staticmethod
+    def _expired_courses_by_user(members):
+        courses = defaultdict(list)
+        for member in members:
+            user_id, course = member.decode().split(':', 1)
+            courses[user_id].append(course)
+
+        return courses
+
+    def _delete_user_expired_courses(self, user_id, courses, cutoff):
+        return self._run_script(self.DELETE_EXPIRED_COURSES_SCRIPT,
+                                [self.KEYS['course_expiry'],
+                                 self.KEYS['course'].format(user_id=user_id),
+                                 self.KEYS['conflicts_sum'].format(user_id=user_id),
+                                 self.KEYS['conflicts_sum_version'].format(user_id=user_id)],
+                                [cutoff, user_id, *courses])
+
+    def delete_expired_courses(self) -> int:
+        """Deselects every course selected more than `EX` seconds ago, for all users.
+
+        Only walks the expired entries of the expiry index, whatever the number of users.
+        Each batch of entries is swept with one script call per user, in one round trip.
+        """
+        cutoff = timezone.now().timestamp() - self.EX
+
+        deleted = 0
+        while True:
+            members = self._get_expired_members(cutoff)
+            with self.batch():
+                results = [self._delete_user_expired_courses(user_id, courses, cutoff)
+                           for user_id, courses in self._expired_courses_by_user(members).items()]
+            deleted += sum(result.value for result in results)
+            if len(members) < self.EXPIRED_COURSES_BATCH:
+                return deleted
+
+    def _conflict_keys(self, university_id, major_id, course_id):
+        return (self.KEYS['conflicts'].format(university_id=university_id, major_id=major_id, course_id=course_id),
+                self.KEYS['conflict_reasons'].format(university_id=university_id, major_id=major_id,
+                                                     course_id=course_id))
+
+    def cache_conflicts(self, university_id, major_id, course_id, conflicts, reasons):
+        client = self._get_redis_client()
 
-    def delete_conflicts(self, course_id):
+        conflicts_key, reasons_key = self._conflict_keys(university_id, major_id, course_id)
+        return self._result(client.mset({
+            conflicts_key: np.packbits(np.asarray(conflicts, dtype=bool)).tobytes(),
+            reasons_key: np.packbits(np.asarray(reasons) == 1).tobytes(),
+        }))
+
+    def cache_conflict_matrix(self, university_id, major_id, course_ids, matrix, reasons):
+        def queue(pipeline):
+            for course_id, conflicts, class_reasons in zip(course_ids,
+                                                           np.packbits(np.asarray(matrix, dtype=bool), axis=1),
+                                                           np.packbits(np.asarray(reasons) == 1, axis=1)):
+                conflicts_key, reasons_key = self._conflict_keys(university_id, major_id, course_id)
+                pipeline.mset({conflicts_key: conflicts.tobytes(), reasons_key: class_reasons.tobytes()})
+            pipeline.incr(self.KEYS['catalog_version'].format(university_id=university_id, major_id=major_id))
+
+        return self._send(queue)
+
+    def patch_conflicts(self, university_id, major_id, course_ids, position, conflicts, reasons):
+        """Rewrites row and column `position` of a catalog's conflict and reason matrices in one pipeline."""
+        def queue(pipeline):
+            for it, (course_id, conflict, reason) in enumerate(zip(course_ids, conflicts, reasons)):
+                conflicts_key, reasons_key = self._conflict_keys(university_id, major_id, course_id)
+                if it == position:
+                    pipeline.mset({
+                        conflicts_key: np.packbits(np.asarray(conflicts, dtype=bool)).tobytes(),
+                        reasons_key: np.packbits(np.asarray(reasons) == 1).tobytes(),
+                    })
+                else:
+                    pipeline.setbit(conflicts_key, position, int(conflict))
+                    pipeline.setbit(reasons_key, position, int(reason == 1))
+            pipeline.incr(self.KEYS['catalog_version'].format(university_id=university_id, major_id=major_id))
+
+        return self._send(queue)
+
+    def bump_catalog_version(self, university_id, major_id):
+        """Makes every process reload its snapshot of the catalog, and rebuild the conflict sums of its users."""
         client = self._get_redis_client()
 
-        client.delete(self.KEYS['conflicts'].format(course_id=course_id))
+        return self._result(client.incr(self.KEYS['catalog_version'].format(university_id=university_id,
+                                                                            major_id=major_id)))
 
-    def get_conflicts_sum(self, user_id) -> List[int]:
+    def get_catalog_version(self, university_id, major_id) -> int:
+        """Bumped every time the courses or conflicts of the catalog change."""
         client = self._get_redis_client()
 
-        return list(map(lambda x: int(x.decode()),
-                        client.lrange(name=self.KEYS['conflicts_sum'].format(user_id=user_id), start=0, end=127)))
+        return self._result(client.get(self.KEYS['catalog_version'].format(university_id=university_id,
+                                                                           major_id=major_id)),
+                            lambda version: int(version or b'0'))
 
-    def init_conflicts_sum(self, user_id, *conflicts):
+    def get_conflicts(self, university_id, major_id, course_id) -> np.ndarray:
+        """Conflict row of the course, padded with zeros to a multiple of 8."""
         client = self._get_redis_client()
 
-        client.rpush(
-            self.KEYS['conflicts_sum'].format(user_id=user_id),
-            *conflicts
-        )
+        return self._result(client.get(self.KEYS['conflicts'].format(university_id=university_id,
+                                                                     major_id=major_id,
+                                                                     course_id=course_id)),
+                            lambda conflicts: np.unpackbits(np.frombuffer(conflicts or b'', dtype=np.uint8)))
 
-    def delete_conflicts_sum(self, user_id):
+    def get_conflict_rows(self, university_id, major_id, course_ids) -> List[Optional[Tuple[np.ndarray, np.ndarray]]]:
+        """Conflict and reason rows of several courses in one round trip, None where a row is missing."""
         client = self._get_redis_client()
 
-        client.delete(self.KEYS['conflicts_sum'].format(user_id=user_id))
+        keys = [key for course_id in course_ids for key in self._conflict_keys(university_id, major_id, course_id)]
+        if not keys:
+            return self._constant([])
+
+        return self._result(client.mget(keys), lambda values: [
+            (np.unpackbits(np.frombuffer(conflicts, dtype=np.uint8)),
+             np.unpackbits(np.frombuffer(reasons, dtype=np.uint8)))
+            if conflicts is not None and reasons is not None else None
+            for conflicts, reasons in zip(values[::2], values[1::2])
+        ])
 
-    def aggregate_conflicts_plus(self, user_id, course_id):
+    def has_conflict_rows(self, university_id, major_id, course_ids) -> bool:
+        """Whether the conflict and reason rows of every course are cached."""
         client = self._get_redis_client()
 
-        conflicts = self.get_conflicts(course_id=course_id)
-        current_conflicts = self.get_conflicts_sum(user_id=user_id)
+        keys = [key for course_id in course_ids for key in self._conflict_keys(university_id, major_id, course_id)]
+        if not keys:
+            return self._constant(True)
+
+        return self._result(client.exists(*keys), lambda count: count == len(keys))
 
-        if not current_conflicts:
-            self.init_conflicts_sum(
-                user_id,
-                *conflicts
-            )
+    def delete_conflicts(self, university_id, major_id, course_id):
+        client = self._get_redis_client()
+
+        return self._result(client.delete(*self._conflict_keys(university_id, major_id, course_id)))
 
-            return
+    def get_conflicts_sum(self, user_id) -> np.ndarray:
+        client = self._get_redis_client()
 
-        self.delete_conflicts_sum(user_id=user_id)
-        client.rpush(
-            self.KEYS['conflicts_sum'].format(user_id=user_id),
-            *list(map(lambda x, y: x + y, conflicts, current_conflicts))
-        )
+        return self._result(client.get(self.KEYS['conflicts_sum'].format(user_id=user_id)),
+                            lambda conflicts: np.frombuffer(conflicts or b'', dtype=self.SUM_DTYPE))
 
-    def aggregate_conflicts_minus(self, user_id, course_id):
+    def get_conflicts_sum_version(self, user_id) -> int:
+        """Catalog version the conflict sum was built for, -1 if it was never built."""
         client = self._get_redis_client()
 
-        conflicts = self.get_conflicts(course_id=course_id)
-        current_conflicts = self.get_conflicts_sum(user_id=user_id)
+        return self._result(client.get(self.KEYS['conflicts_sum_version'].format(user_id=user_id)),
+                            lambda version: int(version) if version is not None else -1)
 
-        if not current_conflicts:
-            self.init_conflicts_sum(
-                user_id,
-                *conflicts
-            )
+    def init_conflicts_sum(self, user_id, conflicts, version):
+        def queue(pipeline):
+            pipeline.set(self.KEYS['conflicts_sum'].format(user_id=user_id),
+                         np.asarray(conflicts, dtype=self.SUM_DTYPE).tobytes())
+            pipeline.set(self.KEYS['conflicts_sum_version'].format(user_id=user_id), version)
 
-            return
+        return self._send(queue)
+
+    def delete_conflicts_sum(self, user_id):
+        client = self._get_redis_client()
 
-        self.delete_conflicts_sum(user_id=user_id)
-        client.rpush(
-            self.KEYS['conflicts_sum'].format(user_id=user_id),
-            *list(map(lambda x, y: x - y, current_conflicts, conflicts))
-        )
+        return self._result(client.delete(self.KEYS['conflicts_sum'].format(user_id=user_id),
+                                          self.KEYS['conflicts_sum_version'].format(user_id=user_id)))
+
+    def _aggregate_conflicts(self, user_id, university_id, major_id, course_id, sign):
+        return self._run_script(self.AGGREGATE_CONFLICTS_SCRIPT,
+                                [self.KEYS['conflicts'].format(university_id=university_id,
+                                                               major_id=major_id,
+                                                               course_id=course_id),
+                                 self.KEYS['conflicts_sum'].format(user_id=user_id)],
+                                [sign])
+
+    def aggregate_conflicts_plus(self, user_id, university_id, major_id, course_id):
+        return self._aggregate_conflicts(user_id, university_id, major_id, course_id, 1)
+
+    def aggregate_conflicts_minus(self, user_id, university_id, major_id, course_id):
+        return self._aggregate_conflicts(user_id, university_id, major_id, course_id, -1)
+
+    def toggle_course(self, user_id, university_id, major_id, course_id) -> bool:
+        return self._run_script(self.TOGGLE_COURSE_SCRIPT,
+                                [self.KEYS['conflicts'].format(university_id=university_id,
+                                                               major_id=major_id,
+                                                               course_id=course_id),
+                                 self.KEYS['conflicts_sum'].format(user_id=user_id),
+                                 self.KEYS['course'].format(user_id=user_id),
+                                 self.KEYS['course_expiry']],
+                                [course_id, timezone.now().timestamp(), self._expiry_member(user_id, course_id)],
+                                bool)
+
+
+# Python versions of the scripts above, for the `local` cache service backend.
+
+def _add_conflicts(client, conflicts_key, sum_key, sign):
+    conflicts = client.get(conflicts_key)
+    if conflicts is None:
+        return 0
+
+    bits = np.unpackbits(np.frombuffer(conflicts, dtype=np.uint8)).astype(np.int32)
+    current = np.frombuffer(client.get(sum_key) or b'', dtype=CacheService.SUM_DTYPE)[:len(bits)]
+    values = np.zeros(len(bits), dtype=np.int32)
+    values[:len(current)] = current
+    client.set(sum_key, np.clip(values + sign * bits, 0, 65535).astype(CacheService.SUM_DTYPE).tobytes())
+    return len(values)
+
+
+@local_script(CacheService.AGGREGATE_CONFLICTS_SCRIPT)
+def _aggregate_conflicts(client, keys, args):
+    return _add_conflicts(client, keys[0], keys[1], int(args[0]))
+
+
+@local_script(CacheService.TOGGLE_COURSE_SCRIPT)
+def _toggle_course(client, keys, args):
+    if client.hexists(keys[2], args[0]):
+        client.hdel(keys[2], args[0])
+        client.zrem(keys[3], args[2])
+        _add_conflicts(client, keys[0], keys[1], -1)
+        return 0
+
+    client.hset(keys[2], args[0], args[1])
+    client.zadd(keys[3], {args[2]: float(args[1])})
+    _add_conflicts(client, keys[0], keys[1], 1)
+    return 1
+
+
+@local_script(CacheService.DELETE_EXPIRED_COURSES_SCRIPT)
+def _delete_expired_courses(client, keys, args):
+    removed = 0
+    for course in args[2:]:
+        member = args[1] + b':' + course
+        score = client.zscore(keys[0], member)
+        if score is not None and score <= float(args[0]):
+            client.hdel(keys[1], course)
+            client.zrem(keys[0], member)
+            removed += 1
+
+    if removed:
+        client.delete(keys[2], keys[3])
+    return removed
+
+
+class AsyncCacheService(AsyncBaseCacheService, CacheService):
+    """`CacheService` for the bot's handlers, every method is awaited outside a batch."""
+
+    async def delete_non_used_courses(self, user_id):
+        courses = await self._get_redis_client().hgetall(self.KEYS['course'].format(user_id=user_id))
+        await self.delete_courses(user_id, *self._non_used_courses(courses))
+
+    async def delete_expired_courses(self) -> int:
+        cutoff = timezone.now().timestamp() - self.EX
+
+        deleted = 0
+        while True:
+            members = await self._get_expired_members(cutoff)
+            async with self.batch():
+                results = [self._delete_user_expired_courses(user_id, courses, cutoff)
+                           for user_id, courses in self._expired_courses_by_user(members).items()]
+            deleted += sum(result.value for result in results)
+            if len(members) < self.EXPIRED_COURSES_BATCH:
+                return deleted
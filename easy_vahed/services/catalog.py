@@ -0,0 +1,79 @@
+from typing import Dict, Tuple, Iterable, List
+from .cache import CacheService
+from .conflict import ConflictService
+
+
+class Catalog:
+    """In-process snapshot of the courses of one (university, major) pair."""
+
+    def __init__(self, university_id, major_id, version, ids, names, labels, weights):
+        self.university_id = university_id
+        self.major_id = major_id
+        self.version = version
+        self.ids = ids
+        self.names = names
+        self.labels = labels
+        self.weights = weights
+        self.positions = {course_id: it for it, course_id in enumerate(ids)}
+        self._pages = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def page_count(self, page_size) -> int:
+        return -(-len(self) // page_size)
+
+    def page(self, page, page_size) -> List[Tuple[int, int, str]]:
+        """(position, course id, label) of every course on `page`, built once per page size."""
+        if page_size not in self._pages:
+            self._pages[page_size] = [
+                [(it, self.ids[it], self.labels[it]) for it in range(start, min(start + page_size, len(self)))]
+                for start in range(0, len(self), page_size)
+            ]
+
+        pages = self._pages[page_size]
+        return pages[page] if 0 <= page < len(pages) else []
+
+    def name(self, course_id) -> str:
+        return self.names[self.positions[int(course_id)]]
+
+    def label(self, course_id) -> str:
+        return self.labels[self.positions[int(course_id)]]
+
+    def weight_sum(self, course_ids: Iterable) -> int:
+        return sum(self.weights[self.positions[int(course_id)]] for course_id in course_ids
+                   if int(course_id) in self.positions)
+
+
+class CatalogService:
+    _catalogs: Dict[Tuple[int, int], Catalog] = {}
+
+    @classmethod
+    def get_catalog(cls, university_id, major_id, version=None) -> Catalog:
+        """Catalog snapshot, reloaded from the database only when its version in Redis moved.
+
+        Pass `version` when it was already read, e.g. as part of a batch.
+        """
+        if version is None:
+            version = CacheService().get_catalog_version(university_id, major_id)
+
+        catalog = cls._catalogs.get((university_id, major_id))
+        if catalog is None or catalog.version != version:
+            catalog = cls._load_catalog(university_id, major_id, version)
+            cls._catalogs[university_id, major_id] = catalog
+
+        return catalog
+
+    @staticmethod
+    def _load_catalog(university_id, major_id, version) -> Catalog:
+        courses = list(ConflictService.get_catalog_courses(university_id, major_id).select_related('professor'))
+
+        return Catalog(
+            university_id=university_id,
+            major_id=major_id,
+            version=version,
+            ids=[course.id for course in courses],
+            names=[course.name for course in courses],
+            labels=[str(course) for course in courses],
+            weights=[course.weight for course in courses],
+        )
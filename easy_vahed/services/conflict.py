@@ -1,6 +1,11 @@
+import heapq
+import time
+import numpy as np
 from easy_vahed.models import Course
-from typing import Tuple, List, Set
+from django.db.models import QuerySet
+from typing import Tuple, List, Iterable, Optional
 from .cache import CacheService
+from .matrix import ConflictMatrixService
 
 
 class ConflictService:
@@ -67,24 +72,239 @@ class ConflictService:
             print(selected_course, course, res)
         return conflicts
 
+    @staticmethod
+    def find_first_conflict(courses: List[Course]) -> Optional[Tuple[Course, Course, int]]:
+        """First conflicting pair, scanning `courses[i]` against every `courses[j]` with `j < i`.
+
+        Needs two queries whatever the number of courses. Returns the pair and its
+        key in `CONFLICT_CODES`, or None.
+        """
+        courses = list(courses)
+        reasons = ConflictMatrixService.reason_matrix(ConflictMatrixService.load_catalog(courses))
+
+        pairs = np.argwhere(np.tril(reasons != ConflictMatrixService.NO_CONFLICT, k=-1))
+        if not len(pairs):
+            return None
+
+        it_1, it_2 = pairs[0]
+        return courses[it_1], courses[it_2], int(reasons[it_1, it_2])
+
+    @staticmethod
+    def to_bitsets(matrix: np.ndarray) -> List[int]:
+        """Turns each row of a conflict matrix into an int whose bit `i` is column `i`."""
+        return [int.from_bytes(np.packbits(row, bitorder='little').tobytes(), 'little')
+                for row in np.asarray(matrix, dtype=bool)]
+
+    @classmethod
+    def find_solution(cls, conflicts: List[int], weights: List[int], selected: Iterable[int] = (),
+                      max_weight: int = 20, k: int = 3, time_budget: float = .5) -> List[Tuple[int, List[int]]]:
+        """Heaviest conflict-free timetables that keep every course in `selected`.
+
+        `conflicts` are the catalog's conflict bitsets (see `to_bitsets`) and `weights`
+        their credits. Branch and bound over the remaining courses, heaviest first,
+        keeping the `k` best maximal timetables whose total weight is at most `max_weight`.
+        When `time_budget` seconds run out the best timetables found so far are returned.
+        Returns (weight, course positions) pairs, heaviest first.
+        """
+        chosen, forbidden, weight = 0, 0, 0
+        for it in selected:
+            if forbidden >> it & 1:
+                return []
+            chosen |= 1 << it
+            forbidden |= conflicts[it]
+            weight += weights[it]
+        if weight > max_weight:
+            return []
+
+        order = sorted((it for it in range(len(weights))
+                        if not (chosen | forbidden) >> it & 1 and 0 < weights[it] <= max_weight - weight),
+                       key=lambda it: -weights[it])
+        remained = [0] * (len(order) + 1)
+        for pos in range(len(order) - 1, -1, -1):
+            remained[pos] = remained[pos + 1] + weights[order[pos]]
+        candidates = sum(1 << it for it in order)
+
+        best = []
+        deadline = time.monotonic() + time_budget
+        stack = [(0, chosen, forbidden, weight)]
+        visited = 0
+        while stack:
+            visited += 1
+            if not visited % 1024 and time.monotonic() > deadline:
+                break
+
+            pos, chosen, forbidden, weight = stack.pop()
+            if len(best) == k and min(max_weight, weight + remained[pos]) <= best[0][0]:
+                continue
+
+            if pos == len(order):
+                # Only keep maximal timetables, not every subset of a good one.
+                free = candidates & ~chosen & ~forbidden
+                if any(free >> it & 1 and weight + weights[it] <= max_weight for it in order):
+                    continue
+                solution = (weight, [it for it in range(len(weights)) if chosen >> it & 1])
+                if len(best) < k:
+                    heapq.heappush(best, solution)
+                else:
+                    heapq.heappushpop(best, solution)
+                continue
+
+            it = order[pos]
+            stack.append((pos + 1, chosen, forbidden, weight))
+            if not forbidden >> it & 1 and weight + weights[it] <= max_weight:
+                stack.append((pos + 1, chosen | 1 << it, forbidden | conflicts[it], weight + weights[it]))
+
+        return sorted(best, key=lambda solution: -solution[0])
+
+    @classmethod
+    def cross_check(cls, courses: List[Course]) -> List[Tuple[Course, Course, int, int]]:
+        """Compares `ConflictMatrixService` with `check_conflict` on every pair.
+
+        Returns the mismatching pairs along with the code each side produced.
+        """
+        courses = list(courses)
+        codes = {reason: code for code, reason in cls.CONFLICT_CODES.items()}
+        reasons = ConflictMatrixService.reason_matrix(ConflictMatrixService.load_catalog(courses))
+
+        mismatches = []
+        for it_1, course_1 in enumerate(courses):
+            for it_2, course_2 in enumerate(courses):
+                has_conflict, reason = cls.check_conflict(course_1, course_2)
+                expected = codes[reason] if has_conflict else ConflictMatrixService.NO_CONFLICT
+                if reasons[it_1, it_2] != expected:
+                    mismatches.append((course_1, course_2, expected, int(reasons[it_1, it_2])))
+
+        return mismatches
+
+    @staticmethod
+    def get_catalogs() -> List[Tuple[int, int]]:
+        """Every (university, major) pair that has at least one course."""
+        return list(Course.majors.through.objects.values_list('course__university_id', 'major_id')
+                    .distinct().order_by('course__university_id', 'major_id'))
+
+    @staticmethod
+    def get_catalog_courses(university_id, major_id) -> QuerySet:
+        """Courses of a catalog, in the order used by the conflict rows and the keyboard."""
+        return Course.objects.filter(university_id=university_id,
+                                     majors=major_id).order_by('id')
+
     @classmethod
-    def find_solution(cls, selected_courses: Set[Course], all_courses: Set[Course]):
-        sol = []
+    def preprocess_conflicts(cls, university_id, major_id):
+        catalog = ConflictMatrixService.load_catalog(cls.get_catalog_courses(university_id, major_id))
+        reasons = ConflictMatrixService.reason_matrix(catalog)
+        matrix = ConflictMatrixService.conflict_matrix(catalog, reasons)
 
-        remained_courses = all_courses - selected_courses
+        CacheService().cache_conflict_matrix(university_id, major_id, catalog.ids.tolist(), matrix, reasons)
 
-        for course in remained_courses:
-            if not cls.has_conflict_one_many(course, list(selected_courses)):
-                sol.append(course)
+    @staticmethod
+    def get_course_catalogs(course_id) -> List[Tuple[int, int]]:
+        return list(Course.majors.through.objects.filter(course_id=course_id)
+                    .values_list('course__university_id', 'major_id'))
 
-        return sol
+    @staticmethod
+    def get_professor_catalogs(professor_id) -> List[Tuple[int, int]]:
+        return list(Course.majors.through.objects.filter(course__professor_id=professor_id)
+                    .values_list('course__university_id', 'major_id').distinct())
 
     @classmethod
-    def preprocess_conflicts(cls, courses: List[Course]):
+    def refresh_course_conflicts(cls, course_id, old_catalogs: Iterable[Tuple[int, int]]):
+        """Brings the cached conflict rows up to date after a single course changed.
+
+        Rows of catalogs the course stays in, or is appended to, are patched in O(n).
+        Catalogs where the positions of other courses shift, or whose other rows are not all
+        cached, are rebuilt, a patch would leave the missing rows mostly zero.
+        Either way the catalog version moves, which makes `choose_courses` rebuild the
+        conflict sums of the users selecting from it.
+        """
         cache_service = CacheService()
+        old_catalogs = set(old_catalogs)
+        catalogs = set(cls.get_course_catalogs(course_id))
 
-        for course in courses:
-            conflicts = cls.get_one_to_many_conflicts(course, courses)
-            cache_service.delete_conflicts(course.id)
-            cache_service.cache_conflicts(course.id, *conflicts)
+        for university_id, major_id in old_catalogs - catalogs:
+            cache_service.delete_conflicts(university_id, major_id, course_id)
+            cls.preprocess_conflicts(university_id, major_id)
+
+        for university_id, major_id in catalogs:
+            catalog = ConflictMatrixService.load_catalog(cls.get_catalog_courses(university_id, major_id))
+            position = int(np.flatnonzero(catalog.ids == course_id)[0])
+
+            with cache_service.batch():
+                version = cache_service.get_catalog_version(university_id, major_id)
+                cached = cache_service.has_conflict_rows(university_id, major_id,
+                                                         [other for other in catalog.ids.tolist() if other != course_id])
+
+            if not version.value or not cached.value or \
+                    ((university_id, major_id) not in old_catalogs and position != len(catalog) - 1):
+                cls.preprocess_conflicts(university_id, major_id)
+                continue
+
+            reasons = ConflictMatrixService.reason_row(catalog, position)
+            cache_service.patch_conflicts(university_id, major_id, catalog.ids.tolist(), position,
+                                          ConflictMatrixService.conflict_row(catalog, position, reasons), reasons)
+
+    @staticmethod
+    def sum_conflict_rows(rows, size) -> np.ndarray:
+        """Conflict sum of the courses whose `get_conflict_rows` are `rows`, missing rows count as no conflict."""
+        conflicts = np.zeros(size, dtype=np.int64)
+        for row in rows:
+            if row is not None:
+                row = row[0][:size]
+                conflicts[:len(row)] += row
+
+        return np.minimum(conflicts, 65535)
+
+    @classmethod
+    def find_first_catalog_conflict(cls, catalog, course_ids: Iterable, rows=None) -> Optional[Tuple[int, int, int]]:
+        """`find_first_conflict` answered from the cached conflict and reason rows.
+
+        `catalog` is the `CatalogService` snapshot the courses belong to. Falls back to
+        the database when a row has not been preprocessed yet, or is too short. Returns the ids of the
+        conflicting pair and its key in `CONFLICT_CODES`, or None.
+
+        `rows` are the catalog's `get_conflict_rows`, in `catalog.ids` order, when the
+        caller already fetched them.
+        """
+        course_ids = sorted(int(course_id) for course_id in course_ids if int(course_id) in catalog.positions)
+        if rows is None:
+            rows = CacheService().get_conflict_rows(catalog.university_id, catalog.major_id, course_ids)
+        else:
+            rows = [rows[catalog.positions[course_id]] for course_id in course_ids]
+
+        # A row too short to reach every position was written for an older version of the catalog.
+        positions = [catalog.positions[course_id] for course_id in course_ids]
+        if any(row is None or len(row[0]) <= max(positions) for row in rows):
+            conflict = cls.find_first_conflict(Course.objects.filter(id__in=course_ids).order_by('id'))
+            return (conflict[0].id, conflict[1].id, conflict[2]) if conflict else None
+
+        for it_1, (conflicts, reasons) in enumerate(rows):
+            for course_id in course_ids[:it_1]:
+                position = catalog.positions[course_id]
+                if conflicts[position]:
+                    return course_ids[it_1], course_id, int(reasons[position])
+
+        return None
+
+    @classmethod
+    def find_catalog_solution(cls, catalog, selected_ids: Iterable[int], rows=None,
+                              **kwargs) -> List[Tuple[int, List[int]]]:
+        """`find_solution` over a `CatalogService` snapshot, keeping the courses with `selected_ids`.
+
+        Takes the same `rows` as `find_first_catalog_conflict`. Returns (weight, course ids) pairs.
+        """
+        if rows is None:
+            rows = CacheService().get_conflict_rows(catalog.university_id, catalog.major_id, catalog.ids)
+        # A row shorter than the catalog was written for an older version of it, as good as missing.
+        if any(row is None or len(row[0]) < len(catalog) for row in rows):
+            matrix = ConflictMatrixService.conflict_matrix(ConflictMatrixService.load_catalog(
+                cls.get_catalog_courses(catalog.university_id, catalog.major_id)
+            ))
+        else:
+            matrix = np.array([conflicts[:len(catalog)] for conflicts, _ in rows], dtype=bool)
+
+        solutions = cls.find_solution(cls.to_bitsets(matrix),
+                                      catalog.weights,
+                                      [catalog.positions[course_id] for course_id in selected_ids
+                                       if course_id in catalog.positions],
+                                      **kwargs)
 
+        return [(weight, [catalog.ids[it] for it in solution]) for weight, solution in solutions]
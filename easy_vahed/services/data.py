@@ -1,35 +1,67 @@
 import pandas as pd
+from django.db import transaction
 from prof.models import Professor, University, Major
 from easy_vahed.models import Course, WeekDay
+from typing import List
+from .conflict import ConflictService
 
 
 class DataService:
 
     @staticmethod
-    def create_course_from_csv(csv_path):
+    def _check_known(model, names, known):
+        unknown = set(names) - set(known)
+        if unknown:
+            raise model.DoesNotExist(f'Unknown {model.__name__} values: {", ".join(map(str, sorted(unknown)))}')
+
+    @classmethod
+    def create_course_from_csv(cls, csv_path) -> List[Course]:
+        """Imports a catalog in one transaction with a fixed number of queries, whatever its size.
+
+        `bulk_create` sends no signals, so the conflicts of the catalogs it touched are
+        preprocessed once the import is committed.
+        """
         df = pd.read_csv(csv_path)
-        df = df.astype({"exam_date": str}, errors='raise')
+        df = df.astype({"exam_date": str, "days": str}, errors='raise')
 
         df.exam_date = '2023-01-' + df.exam_date
-        for index, row in df.iterrows():
-            course_params = row.to_dict()
-            if not Professor.objects.filter(name=course_params['professor']).exists():
-                Professor.objects.create(name=course_params['professor'])
-            p = Professor.objects.get(name=course_params['professor'])
-            u = University.objects.get(name=course_params['university'])
-            m = Major.objects.get(name=course_params['majors'])
-            c = Course(
-                name=course_params['name'],
-                professor=p,
-                university=u,
-                weight=course_params['weight'],
-                start_hour=course_params['start_time'],
-                end_hour=course_params['end_time'],
-                exam_date=course_params['exam_date'],
-                exam_start=course_params['exam_start'],
-                exam_end=course_params['exam_end'],
-            )
-
-            c.save()
-            c.majors.add(m)
-            [c.days.add(WeekDay.objects.get(day=d)) for d in course_params['days'].split(':')]
+        rows = df.to_dict('records')
+
+        universities = dict(University.objects.values_list('name', 'id'))
+        majors = dict(Major.objects.values_list('name', 'id'))
+        weekdays = dict(WeekDay.objects.values_list('day', 'id'))
+        cls._check_known(University, df.university, universities)
+        cls._check_known(Major, df.majors, majors)
+        cls._check_known(WeekDay, {int(d) for days in df.days for d in days.split(':')}, weekdays)
+
+        with transaction.atomic():
+            professors = dict(Professor.objects.values_list('name', 'id'))
+            Professor.objects.bulk_create([Professor(name=name) for name in set(df.professor) - professors.keys()])
+            professors = dict(Professor.objects.values_list('name', 'id'))
+
+            courses = Course.objects.bulk_create([Course(
+                name=row['name'],
+                professor_id=professors[row['professor']],
+                university_id=universities[row['university']],
+                weight=row['weight'],
+                start_hour=row['start_time'],
+                end_hour=row['end_time'],
+                exam_date=row['exam_date'],
+                exam_start=row['exam_start'],
+                exam_end=row['exam_end'],
+            ) for row in rows])
+
+            Course.majors.through.objects.bulk_create([
+                Course.majors.through(course_id=course.id, major_id=majors[row['majors']])
+                for course, row in zip(courses, rows)
+            ])
+            Course.days.through.objects.bulk_create([
+                Course.days.through(course_id=course.id, weekday_id=weekdays[int(d)])
+                for course, row in zip(courses, rows) for d in row['days'].split(':')
+            ])
+
+            catalogs = sorted({(universities[row['university']], majors[row['majors']]) for row in rows})
+            transaction.on_commit(lambda: [ConflictService.preprocess_conflicts(university_id, major_id)
+                                           for university_id, major_id in catalogs])
+
+        return courses
@@ -0,0 +1,126 @@
+import numpy as np
+from easy_vahed.models import Course
+from typing import Iterable
+
+
+class CourseCatalog:
+    """Numeric snapshot of a list of courses, in the order they were given."""
+
+    def __init__(self, ids, university, day_mask, class_start, class_end, exam_date, exam_start, exam_end):
+        self.ids = ids
+        self.university = university
+        self.day_mask = day_mask
+        self.class_start = class_start
+        self.class_end = class_end
+        self.exam_date = exam_date
+        self.exam_start = exam_start
+        self.exam_end = exam_end
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class ConflictMatrixService:
+    NO_CONFLICT = -1
+    BATCH_SIZE = 512
+
+    @staticmethod
+    def _time_to_number(t) -> int:
+        # Microseconds since midnight, so comparisons match `datetime.time` exactly.
+        return ((t.hour * 60 + t.minute) * 60 + t.second) * 1_000_000 + t.microsecond
+
+    @classmethod
+    def load_catalog(cls, courses: Iterable[Course]) -> CourseCatalog:
+        courses = list(courses)
+        ids = [course.id for course in courses]
+
+        days = {}
+        day_bits = {}
+        for course_id, weekday_id in Course.days.through.objects.filter(course_id__in=ids) \
+                .values_list('course_id', 'weekday_id'):
+            bit = day_bits.setdefault(weekday_id, len(day_bits))
+            days[course_id] = days.get(course_id, 0) | (1 << bit)
+
+        if len(day_bits) > 64:
+            raise ValueError('Day mask supports at most 64 distinct weekdays')
+
+        to_number = cls._time_to_number
+        return CourseCatalog(
+            ids=np.array(ids, dtype=np.int64),
+            university=np.array([course.university_id for course in courses], dtype=np.int64),
+            day_mask=np.array([days.get(course_id, 0) for course_id in ids], dtype=np.uint64),
+            class_start=np.array([to_number(course.start_hour) for course in courses], dtype=np.int64),
+            class_end=np.array([to_number(course.end_hour) for course in courses], dtype=np.int64),
+            exam_date=np.array([course.exam_date.toordinal() for course in courses], dtype=np.int64),
+            exam_start=np.array([to_number(course.exam_start) for course in courses], dtype=np.int64),
+            exam_end=np.array([to_number(course.exam_end) for course in courses], dtype=np.int64),
+        )
+
+    @staticmethod
+    def _period_conflict(start_1, end_1, start_2, end_2) -> np.ndarray:
+        # Element-wise version of `ConflictService._check_period_hours_conflict`.
+        return (start_1 == start_2) | (end_1 == end_2) | \
+               ((start_1 < start_2) & (end_1 >= start_2)) | \
+               ((start_1 > start_2) & (end_2 >= start_1))
+
+    @classmethod
+    def _reason_block(cls, catalog: CourseCatalog, rows: slice) -> np.ndarray:
+        same_university = catalog.university[rows, None] == catalog.university[None, :]
+        exam = same_university & \
+            (catalog.exam_date[rows, None] == catalog.exam_date[None, :]) & \
+            cls._period_conflict(catalog.exam_start[rows, None], catalog.exam_end[rows, None],
+                                 catalog.exam_start[None, :], catalog.exam_end[None, :])
+        shared_day = (catalog.day_mask[rows, None] & catalog.day_mask[None, :]) != 0
+        klass = same_university & ~exam & shared_day & \
+            cls._period_conflict(catalog.class_start[rows, None], catalog.class_end[rows, None],
+                                 catalog.class_start[None, :], catalog.class_end[None, :])
+
+        block = np.full(exam.shape, cls.NO_CONFLICT, dtype=np.int8)
+        block[klass] = 1
+        block[exam] = 0
+
+        return block
+
+    @classmethod
+    def reason_matrix(cls, catalog: CourseCatalog) -> np.ndarray:
+        """Conflict code of every pair, as keys of `ConflictService.CONFLICT_CODES`.
+
+        Follows `ConflictService.check_conflict` pair by pair, including the
+        diagonal, where a course always conflicts with itself.
+        """
+        n = len(catalog)
+        reasons = np.empty((n, n), dtype=np.int8)
+
+        for start in range(0, n, cls.BATCH_SIZE):
+            rows = slice(start, min(start + cls.BATCH_SIZE, n))
+            reasons[rows] = cls._reason_block(catalog, rows)
+
+        return reasons
+
+    @classmethod
+    def reason_row(cls, catalog: CourseCatalog, position: int) -> np.ndarray:
+        """Row `position` of `reason_matrix`, in O(n)."""
+        return cls._reason_block(catalog, slice(position, position + 1))[0]
+
+    @classmethod
+    def conflict_matrix(cls, catalog: CourseCatalog, reasons: np.ndarray = None) -> np.ndarray:
+        """Boolean conflict matrix, with a course never conflicting with itself.
+
+        Pass the catalog's `reason_matrix` as `reasons` to skip computing it again.
+        """
+        if reasons is None:
+            reasons = cls.reason_matrix(catalog)
+        matrix = reasons != cls.NO_CONFLICT
+        matrix[catalog.ids[:, None] == catalog.ids[None, :]] = False
+
+        return matrix
+
+    @classmethod
+    def conflict_row(cls, catalog: CourseCatalog, position: int, reasons: np.ndarray = None) -> np.ndarray:
+        """Row `position` of `conflict_matrix`, in O(n). Conflicts are symmetric, so it is the column too."""
+        if reasons is None:
+            reasons = cls.reason_row(catalog, position)
+        row = reasons != cls.NO_CONFLICT
+        row[catalog.ids == catalog.ids[position]] = False
+
+        return row
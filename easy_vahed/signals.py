@@ -0,0 +1,65 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+from easy_vahed.models import Course
+from easy_vahed.services import CacheService, ConflictService
+from prof.models import Professor
+
+
+def _refresh_on_commit(course_id, old_catalogs):
+    transaction.on_commit(lambda: ConflictService.refresh_course_conflicts(course_id, old_catalogs))
+
+
+@receiver(pre_save, sender=Course)
+@receiver(pre_delete, sender=Course)
+def remember_course_catalogs(sender, instance: Course, **kwargs):
+    instance._old_catalogs = ConflictService.get_course_catalogs(instance.pk) if instance.pk else []
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def refresh_course_conflicts(sender, instance: Course, **kwargs):
+    _refresh_on_commit(instance.pk, getattr(instance, '_old_catalogs', []))
+
+
+@receiver(m2m_changed, sender=Course.days.through)
+def refresh_course_days_conflicts(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    course_ids = (pk_set or []) if reverse else [instance.pk]
+    if reverse and action == 'post_clear':
+        course_ids = getattr(instance, '_cleared_course_ids', [])
+
+    for course_id in course_ids:
+        _refresh_on_commit(course_id, ConflictService.get_course_catalogs(course_id))
+
+
+@receiver(m2m_changed, sender=Course.days.through)
+def remember_cleared_day_courses(sender, instance, action, reverse, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._cleared_course_ids = list(instance.course_set.values_list('id', flat=True))
+
+
+@receiver(m2m_changed, sender=Course.majors.through)
+def refresh_course_majors_conflicts(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # A major gaining or losing courses moves positions around, rebuild its catalogs.
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            transaction.on_commit(lambda: [ConflictService.preprocess_conflicts(university_id, major_id)
+                                           for university_id, major_id in ConflictService.get_catalogs()
+                                           if major_id == instance.pk])
+        return
+
+    if action in ('pre_add', 'pre_remove', 'pre_clear'):
+        instance._old_catalogs = ConflictService.get_course_catalogs(instance.pk)
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        _refresh_on_commit(instance.pk, getattr(instance, '_old_catalogs', []))
+
+
+@receiver(post_save, sender=Professor)
+def refresh_professor_labels(sender, instance: Professor, **kwargs):
+    # Course labels carry the professor's name, a new catalog version reloads them in every process.
+    catalogs = ConflictService.get_professor_catalogs(instance.pk)
+    transaction.on_commit(lambda: [CacheService().bump_catalog_version(university_id, major_id)
+                                   for university_id, major_id in catalogs])
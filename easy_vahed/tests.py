@@ -1,3 +1,492 @@
-from django.test import TestCase
+import asyncio
+import contextlib
+import datetime
+import io
+import itertools
+import os
+import random
+import time
+from types import SimpleNamespace
+from unittest import mock
+import numpy as np
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from redis.exceptions import RedisError
+from _helpers import BaseCacheService, LocalRedis
+from easy_vahed.models import Course, WeekDay
+from easy_vahed.services import CacheService, CatalogService, ConflictService, ConflictMatrixService
+from easy_vahed.services.catalog import Catalog
+from easy_vahed.services.data import DataService
+from prof.enums import MajorChoices, UniversityChoices
+from prof.models import Major, Professor, University
 
-# Create your tests here.
+# Flushed by the tests, keep it apart from the bot's database
+TEST_REDIS_LOCATION = os.environ.get('TEST_REDIS_LOCATION', 'redis://127.0.0.1:6379/15')
+
+
+class CacheScriptsTest(SimpleTestCase):
+    """Runs the same operations through the Lua scripts of `CacheService`, on Redis, and through
+    their `local_script` versions, on `LocalRedis`, which must agree.
+    """
+    UNIVERSITY_ID = 1
+    MAJOR_ID = 1
+    COURSES = 20
+    USERS = 3
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        matrix = np.triu(rng.random((self.COURSES, self.COURSES)) < .3, k=1)
+        self.matrix = matrix | matrix.T
+        self.reasons = rng.integers(0, 2, (self.COURSES, self.COURSES))
+        self.course_ids = list(range(1, self.COURSES + 1))
+
+        random.seed(0)
+        self.operations = [(random.randrange(self.USERS), random.choice(self.course_ids)) for _ in range(80)]
+
+    def _run(self, backend):
+        BaseCacheService._scripts.clear()
+        LocalRedis._instance = None
+        try:
+            with override_settings(CACHE_SERVICE_BACKEND=backend):
+                return self._operate(CacheService())
+        finally:
+            BaseCacheService._scripts.clear()
+            LocalRedis._instance = None
+
+    def _operate(self, service):
+        client = service._get_connection()
+        client.flushdb()
+        service.cache_conflict_matrix(self.UNIVERSITY_ID, self.MAJOR_ID, self.course_ids, self.matrix, self.reasons)
+
+        results = []
+        for user_id, course_id in self.operations:
+            selected = service.toggle_course(user_id, self.UNIVERSITY_ID, self.MAJOR_ID, course_id)
+            results.append((selected, service.get_conflicts_sum(user_id).tolist()))
+
+        service.aggregate_conflicts_plus(0, self.UNIVERSITY_ID, self.MAJOR_ID, self.course_ids[0])
+        service.aggregate_conflicts_minus(1, self.UNIVERSITY_ID, self.MAJOR_ID, self.course_ids[1])
+        results.append([service.get_conflicts_sum(user_id).tolist() for user_id in range(self.USERS)])
+
+        expired = timezone.now().timestamp() - service.EX - 60
+        for user_id in range(self.USERS):
+            for course_id in sorted(service.get_courses(user_id), key=int)[::2]:
+                client.zadd(service.KEYS['course_expiry'], {f'{user_id}:{course_id}': expired})
+        results.append(service.delete_expired_courses())
+        results.append([(sorted(service.get_courses(user_id), key=int),
+                         service.get_conflicts_sum_version(user_id),
+                         service.get_conflicts_sum(user_id).tolist()) for user_id in range(self.USERS)])
+
+        return results
+
+    def test_local_scripts_sum_the_selected_rows(self):
+        results = self._run('local')
+
+        selected = [set() for _ in range(self.USERS)]
+        for (user_id, course_id), (is_selected, conflicts) in zip(self.operations, results):
+            (selected[user_id].add if is_selected else selected[user_id].discard)(course_id)
+            self.assertEqual(is_selected, course_id in selected[user_id])
+
+            expected = self.matrix[[course_id - 1 for course_id in selected[user_id]]].sum(axis=0)
+            self.assertEqual(conflicts[:self.COURSES], expected.tolist())
+
+    @override_settings(CACHES={'default': {**settings.CACHES['default'], 'LOCATION': TEST_REDIS_LOCATION}})
+    def test_local_scripts_match_redis(self):
+        try:
+            BaseCacheService._get_connection().ping()
+        except RedisError:
+            self.skipTest(f'No Redis at {TEST_REDIS_LOCATION}')
+
+        self.assertEqual(self._run('redis'), self._run('local'))
+
+
+class CatalogFixtures:
+    """A catalog of one university and major on the `LocalRedis` store, emptied around each test."""
+
+    def _committed(self):
+        """Runs the on-commit callbacks of the block, as committing it would."""
+        raise NotImplementedError
+
+    def setUp(self):
+        BaseCacheService._scripts.clear()
+        LocalRedis._instance = None
+        CatalogService._catalogs.clear()
+        self.university = University.objects.create(name=UniversityChoices.aut)
+        self.major = Major.objects.create(name=MajorChoices.cs)
+        self.professor = Professor.objects.create(name='Professor')
+        self.days = WeekDay.objects.bulk_create([WeekDay(day=day) for day in range(7)])
+
+    def tearDown(self):
+        BaseCacheService._scripts.clear()
+        LocalRedis._instance = None
+
+    def _course(self, name, days=(0,), hours=(8, 10), exam_date=datetime.date(2023, 1, 10), exam_hours=(9, 11),
+                weight=3, majors=None, university=None):
+        with self._committed():
+            course = Course.objects.create(name=name, professor=self.professor,
+                                           university=university or self.university,
+                                           weight=weight,
+                                           start_hour=datetime.time(hours[0]), end_hour=datetime.time(hours[1]),
+                                           exam_date=exam_date, exam_start=datetime.time(exam_hours[0]),
+                                           exam_end=datetime.time(exam_hours[1]))
+            course.days.set([self.days[day] for day in days])
+            course.majors.set(majors if majors is not None else [self.major])
+
+        return course
+
+    def _catalog(self):
+        return ConflictService.get_catalog_courses(self.university.id, self.major.id)
+
+
+@override_settings(CACHE_SERVICE_BACKEND='local')
+class CatalogTestCase(CatalogFixtures, TestCase):
+
+    def _committed(self):
+        return self.captureOnCommitCallbacks(execute=True)
+
+
+@override_settings(CACHE_SERVICE_BACKEND='local')
+class CatalogTransactionTestCase(CatalogFixtures, TransactionTestCase):
+    """For code reading the catalog from the database threads, which can't see a `TestCase`'s transaction."""
+
+    def _committed(self):
+        # Every query commits right away
+        return contextlib.nullcontext()
+
+
+class RefreshCourseConflictsTest(CatalogTestCase):
+
+    def _rows(self):
+        course_ids = list(self._catalog().values_list('id', flat=True))
+        rows = CacheService().get_conflict_rows(self.university.id, self.major.id, course_ids)
+        self.assertNotIn(None, rows)
+        return [(conflicts[:len(course_ids)].tolist(), reasons[:len(course_ids)].tolist())
+                for conflicts, reasons in rows]
+
+    def assertRowsRebuilt(self):
+        patched = self._rows()
+        ConflictService.preprocess_conflicts(self.university.id, self.major.id)
+        self.assertEqual(patched, self._rows())
+
+    def test_patched_rows_match_a_rebuild(self):
+        courses = [
+            self._course('A', days=(0,), hours=(8, 10)),
+            self._course('B', days=(0, 2), hours=(9, 11)),
+            self._course('C', days=(1,), hours=(8, 10), exam_hours=(10, 12)),
+            self._course('D', days=(3,), hours=(14, 16), exam_date=datetime.date(2023, 1, 12)),
+        ]
+        # As if never preprocessed: the first change must not patch rows that do not exist
+        CacheService._get_connection().flushdb()
+        self.assertEqual(CacheService().get_catalog_version(self.university.id, self.major.id), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            courses[3].start_hour = datetime.time(8)
+            courses[3].save()
+        self.assertRowsRebuilt()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            courses[2].start_hour, courses[2].end_hour = datetime.time(13), datetime.time(15)
+            courses[2].save()
+        self.assertRowsRebuilt()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            courses[3].days.add(self.days[0])
+        self.assertRowsRebuilt()
+
+        courses.append(self._course('E', days=(2,), hours=(10, 12)))
+        self.assertRowsRebuilt()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            courses.pop(1).delete()
+        self.assertRowsRebuilt()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            courses.pop(0).majors.remove(self.major)
+        self.assertRowsRebuilt()
+
+
+class FindFirstCatalogConflictTest(CatalogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Eight courses without conflicts, then two at the same time
+        self.courses = [self._course(f'C{it}', days=(1,), hours=(2 * it, 2 * it + 1),
+                                     exam_date=datetime.date(2023, 1, 1 + it)) for it in range(8)]
+        self.courses += [self._course(f'C{it}', days=(0,), hours=(8, 10),
+                                      exam_date=datetime.date(2023, 1, 1 + it)) for it in (8, 9)]
+        self.catalog = CatalogService.get_catalog(self.university.id, self.major.id)
+        self.expected = (self.courses[9].id, self.courses[8].id, 1)
+
+    def test_finds_the_conflict_from_the_cached_rows(self):
+        self.assertEqual(ConflictService.find_first_catalog_conflict(
+            self.catalog, [course.id for course in self.courses]), self.expected)
+
+    def test_short_row_falls_back_to_the_database(self):
+        # Written when the catalog had at most 8 courses, it can not reach position 8
+        CacheService().cache_conflicts(self.university.id, self.major.id, self.courses[9].id, [0] * 8, [0] * 8)
+
+        self.assertEqual(ConflictService.find_first_catalog_conflict(
+            self.catalog, [self.courses[8].id, self.courses[9].id]), self.expected)
+
+
+class ConflictMatrixServiceTest(CatalogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        january = lambda day: datetime.date(2023, 1, day)
+        self.courses = [
+            self._course('A', days=(0,), hours=(8, 10), exam_date=january(10), exam_hours=(9, 11)),
+            # Class at the same time as A
+            self._course('B', days=(0,), hours=(9, 11), exam_date=january(11)),
+            # Same hours as A, other day
+            self._course('C', days=(1,), hours=(8, 10), exam_date=january(12)),
+            # Exam during A's
+            self._course('D', days=(2,), hours=(14, 16), exam_date=january(10), exam_hours=(10, 12)),
+            # Same day as A, later
+            self._course('E', days=(0, 3), hours=(12, 13), exam_date=january(13)),
+            # Both clash with A, the exam wins
+            self._course('F', days=(0,), hours=(8, 10), exam_date=january(10), exam_hours=(9, 11)),
+            # Like A, at another university
+            self._course('G', days=(0,), hours=(8, 10), exam_date=january(10), exam_hours=(9, 11),
+                         university=University.objects.create(name=UniversityChoices.sut)),
+            # Starts when A ends, which counts as a conflict
+            self._course('H', days=(0,), hours=(10, 11), exam_date=january(14)),
+        ]
+
+    def test_matches_check_conflict(self):
+        self.assertEqual(ConflictService.cross_check(Course.objects.order_by('id')), [])
+
+    def test_rows(self):
+        catalog = ConflictMatrixService.load_catalog(Course.objects.order_by('id'))
+
+        reasons = ConflictMatrixService.reason_row(catalog, 0)
+        self.assertEqual(reasons.tolist(), [0, 1, -1, 0, -1, 0, -1, 1])
+        self.assertEqual(ConflictMatrixService.conflict_row(catalog, 0, reasons).tolist(),
+                         [False, True, False, True, False, True, False, True])
+        self.assertEqual(ConflictMatrixService.reason_row(catalog, 4).tolist(), [-1, -1, -1, -1, 0, -1, -1, -1])
+        self.assertEqual(ConflictMatrixService.reason_matrix(catalog)[1].tolist(),
+                         ConflictMatrixService.reason_row(catalog, 1).tolist())
+
+
+class FindSolutionTest(SimpleTestCase):
+    """`ConflictService.find_solution` against every subset of small random catalogs."""
+
+    @staticmethod
+    def _instance(rng, size):
+        matrix = np.triu(rng.random((size, size)) < .3, k=1)
+        weights = rng.integers(0, 5, size).tolist()
+        return matrix | matrix.T, weights
+
+    @staticmethod
+    def _is_free(matrix, courses):
+        return not matrix[np.ix_(courses, courses)].any()
+
+    def _is_maximal(self, matrix, weights, courses, max_weight):
+        weight = sum(weights[it] for it in courses)
+        return all(it in courses or not weights[it] or weight + weights[it] > max_weight
+                   or not self._is_free(matrix, [*courses, it]) for it in range(len(weights)))
+
+    def _brute_force(self, matrix, weights, selected, max_weight):
+        candidates = [it for it in range(len(weights)) if weights[it] and it not in selected]
+        solutions = []
+        for size in range(len(candidates) + 1):
+            for chosen in itertools.combinations(candidates, size):
+                courses = sorted([*selected, *chosen])
+                weight = sum(weights[it] for it in courses)
+                if weight <= max_weight and self._is_free(matrix, courses) and \
+                        self._is_maximal(matrix, weights, courses, max_weight):
+                    solutions.append((weight, courses))
+
+        return solutions
+
+    def _assert_valid(self, matrix, weights, solutions, selected, max_weight, k):
+        self.assertLessEqual(len(solutions), k)
+        self.assertEqual(len({tuple(courses) for _, courses in solutions}), len(solutions))
+        for weight, courses in solutions:
+            self.assertEqual(weight, sum(weights[it] for it in courses))
+            self.assertLessEqual(weight, max_weight)
+            self.assertTrue(set(selected) <= set(courses))
+            self.assertTrue(self._is_free(matrix, courses))
+            self.assertTrue(self._is_maximal(matrix, weights, courses, max_weight))
+            self.assertTrue(all(weights[it] for it in courses if it not in selected))
+
+    def test_matches_brute_force(self):
+        rng = np.random.default_rng(0)
+        for _ in range(40):
+            matrix, weights = self._instance(rng, int(rng.integers(4, 11)))
+            max_weight, k = int(rng.integers(3, 15)), int(rng.integers(1, 5))
+            free = [it for it in range(len(weights)) if not matrix[it].any()]
+            selected = free[:1]
+
+            solutions = ConflictService.find_solution(ConflictService.to_bitsets(matrix), weights, selected,
+                                                      max_weight=max_weight, k=k)
+            expected = self._brute_force(matrix, weights, selected, max_weight)
+
+            self._assert_valid(matrix, weights, solutions, selected, max_weight, k)
+            self.assertEqual([weight for weight, _ in solutions],
+                             sorted((weight for weight, _ in expected), reverse=True)[:k])
+            for solution in solutions:
+                self.assertIn(solution, [(weight, courses) for weight, courses in expected])
+
+    def test_conflicting_or_too_heavy_selection_has_no_solution(self):
+        matrix = np.array([[0, 1, 0], [1, 0, 0], [0, 0, 0]], dtype=bool)
+        bitsets = ConflictService.to_bitsets(matrix)
+
+        self.assertEqual(ConflictService.find_solution(bitsets, [3, 3, 3], [0, 1]), [])
+        self.assertEqual(ConflictService.find_solution(bitsets, [3, 3, 3], [0, 2], max_weight=5), [])
+
+    def test_expired_time_budget_returns_the_best_found(self):
+        # Dense enough that the bound prunes little, the budget runs out after the first 1024 nodes
+        rng = np.random.default_rng(1)
+        matrix = np.triu(rng.random((60, 60)) < .5, k=1)
+        matrix |= matrix.T
+        weights = rng.integers(1, 5, 60).tolist()
+        bitsets = ConflictService.to_bitsets(matrix)
+
+        started = time.monotonic()
+        solutions = ConflictService.find_solution(bitsets, weights, max_weight=1000, k=3, time_budget=0)
+        self.assertLess(time.monotonic() - started, 1)
+
+        self.assertEqual(len(solutions), 3)
+        self._assert_valid(matrix, weights, solutions, [], 1000, 3)
+        best = ConflictService.find_solution(bitsets, weights, max_weight=1000, k=3, time_budget=60)
+        self.assertLess(solutions[0][0], best[0][0])
+
+
+class DataServiceTest(CatalogTestCase):
+    CSV = """name,professor,university,majors,weight,days,start_time,end_time,exam_date,exam_start,exam_end
+A,Rahmati,aut,cs,3,1:3,13:30,15:00,10,09:00,11:00
+B,Professor,aut,ce,4,0,15:00,16:30,18,09:00,11:00
+C,Rahmati,aut,cs,2,1:4,14:00,16:00,8,13:00,15:00
+"""
+
+    def setUp(self):
+        super().setUp()
+        self.other_major = Major.objects.create(name=MajorChoices.ce)
+
+    def _import(self, csv):
+        return DataService.create_course_from_csv(io.StringIO(csv))
+
+    def test_imports_courses_with_their_majors_and_days(self):
+        with mock.patch.object(ConflictService, 'preprocess_conflicts',
+                               wraps=ConflictService.preprocess_conflicts) as preprocess:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks, self.assertNumQueries(11):
+                courses = self._import(self.CSV)
+                preprocess.assert_not_called()
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(preprocess.call_args_list, [mock.call(self.university.id, self.major.id),
+                                                     mock.call(self.university.id, self.other_major.id)])
+        self.assertEqual([course.name for course in courses], ['A', 'B', 'C'])
+        self.assertEqual(sorted(Professor.objects.values_list('name', flat=True)), ['Professor', 'Rahmati'])
+
+        courses = {course.name: course for course in Course.objects.prefetch_related('majors', 'days')}
+        self.assertEqual({name: [major.name for major in course.majors.all()] for name, course in courses.items()},
+                         {'A': ['cs'], 'B': ['ce'], 'C': ['cs']})
+        self.assertEqual({name: sorted(day.day for day in course.days.all()) for name, course in courses.items()},
+                         {'A': [1, 3], 'B': [0], 'C': [1, 4]})
+        self.assertEqual((courses['C'].professor.name, courses['C'].weight, courses['C'].exam_date,
+                          courses['C'].start_hour), ('Rahmati', 2, datetime.date(2023, 1, 8), datetime.time(14)))
+
+        # A and C share Monday afternoon
+        self.assertEqual(ConflictService.find_first_catalog_conflict(
+            CatalogService.get_catalog(self.university.id, self.major.id), [courses['A'].id, courses['C'].id]),
+            (courses['C'].id, courses['A'].id, 1))
+
+    def test_query_count_does_not_depend_on_the_size(self):
+        rows = self.CSV.splitlines()
+        with self.captureOnCommitCallbacks(), self.assertNumQueries(11):
+            self._import('\n'.join(rows + rows[1:] * 10))
+
+    def test_unknown_values_roll_back_everything(self):
+        for old, new, model, unknown in [('aut', 'mit', University, 'mit'), (',cs,', ',law,', Major, 'law'),
+                                         ('1:3', '1:9', WeekDay, '9')]:
+            with self.subTest(model=model.__name__):
+                with self.captureOnCommitCallbacks() as callbacks, \
+                        self.assertRaisesMessage(model.DoesNotExist, f'Unknown {model.__name__} values: {unknown}'):
+                    self._import(self.CSV.replace(old, new, 1))
+
+                self.assertEqual(callbacks, [])
+                self.assertFalse(Course.objects.exists())
+                self.assertEqual(list(Professor.objects.values_list('name', flat=True)), ['Professor'])
+
+
+class CatalogServiceTest(CatalogTestCase):
+
+    def test_renaming_a_professor_reloads_the_labels(self):
+        course = self._course('A')
+        catalog = CatalogService.get_catalog(self.university.id, self.major.id)
+        self.assertEqual(catalog.label(course.id), 'A - Professor')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.professor.name = 'Renamed'
+            self.professor.save()
+
+        catalog = CatalogService.get_catalog(self.university.id, self.major.id)
+        self.assertEqual(catalog.label(course.id), 'A - Renamed')
+
+
+class CatalogPageTest(SimpleTestCase):
+
+    def test_pages(self):
+        catalog = Catalog(1, 1, 1, ids=list(range(1, 8)), names=list('ABCDEFG'), labels=list('ABCDEFG'),
+                          weights=[3] * 7)
+
+        self.assertEqual(catalog.page_count(3), 3)
+        self.assertEqual(catalog.page(2, 3), [(6, 7, 'G')])
+        self.assertEqual((catalog.page(3, 3), catalog.page(-1, 3)), ([], []))
+        self.assertEqual(catalog.page_count(7), 1)
+        self.assertEqual(catalog.page(0, 7), catalog.page(0, 3) + catalog.page(1, 3) + catalog.page(2, 3))
+
+
+@override_settings(CHOOSE_COURSES_PAGE_SIZE=3)
+class ChooseCoursesPagingTest(CatalogTransactionTestCase):
+    USER_ID = 7
+
+    def setUp(self):
+        super().setUp()
+        self.courses = [self._course(f'C{it}', days=(it % 7,), exam_date=datetime.date(2023, 1, 1 + it))
+                        for it in range(7)]
+        self.user_data = {'catalog': (self.university.id, self.major.id)}
+
+    def _press(self, data):
+        """Courses and page buttons of the keyboard shown after pressing `data`, None when it was not redrawn."""
+        import bot
+
+        query = SimpleNamespace(from_user=SimpleNamespace(id=self.USER_ID), data=data,
+                                answer=mock.AsyncMock(), edit_message_text=mock.AsyncMock())
+        state = asyncio.run(bot.choose_courses(SimpleNamespace(callback_query=query),
+                                               SimpleNamespace(user_data=self.user_data)))
+        self.assertEqual(state, settings.STATES['choose_courses'])
+        if not query.edit_message_text.await_count:
+            return None
+
+        keyboard = query.edit_message_text.await_args.kwargs['reply_markup'].inline_keyboard
+        courses = [row[0].callback_data for row in keyboard if row[0].callback_data[0] in 'CZ']
+        pages = [button.text for row in keyboard for button in row if button.callback_data[0] == 'P']
+        return courses, pages
+
+    def test_last_page_is_partial(self):
+        self.assertEqual(self._press('0'), ([f'C{course.id}' for course in self.courses[:3]], ['1/3', '»']))
+        self.assertEqual(self._press('P2'), ([f'C{self.courses[6].id}'], ['«', '3/3']))
+        self.assertIsNone(self._press('P2'))
+        self.assertEqual(self.user_data['courses_page'], 2)
+
+    def test_stale_page_after_the_catalog_shrinks(self):
+        self._press('P2')
+        for course in self.courses[3:]:
+            course.delete()
+
+        # A callback of the keyboard shown before, for a page that no longer exists
+        self.assertEqual(self._press('P2'), ([f'C{course.id}' for course in self.courses[:3]], []))
+        self.assertEqual(self.user_data['courses_page'], 0)
+
+    def test_page_size_changes(self):
+        self._press('P2')
+
+        with self.settings(CHOOSE_COURSES_PAGE_SIZE=5):
+            self.assertEqual(self._press('0'), ([f'C{course.id}' for course in self.courses[5:]], ['«', '2/2']))
+        self.assertEqual(self.user_data['courses_page'], 1)
+
+        with self.settings(CHOOSE_COURSES_PAGE_SIZE=10):
+            self.assertEqual(self._press('0'), ([f'C{course.id}' for course in self.courses], []))
+        self.assertEqual(self.user_data['courses_page'], 0)
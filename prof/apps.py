@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ProfConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'prof'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -1 +1,4 @@
 from .name_mapping import NameMappingService
+from .cache import ReferenceCacheService, ProfileCacheService, AsyncProfileCacheService
+from .reference import ReferenceService
+from .student import StudentService, StudentIdentity
@@ -0,0 +1,63 @@
+import json
+from _helpers import BaseCacheService, AsyncBaseCacheService
+from typing import Dict, Optional
+
+
+class ReferenceCacheService(BaseCacheService):
+    PREFIX = 'P'
+    KEYS = {
+        'names': f'{PREFIX}:''{kind}_NAMES',
+    }
+    EX = 60 * 60 * 24
+
+    def cache_names(self, kind, names: Dict[int, str]):
+        client = self._get_redis_client()
+
+        return self._result(client.set(self.KEYS['names'].format(kind=kind),
+                                       json.dumps(list(names.items())),
+                                       ex=self.EX))
+
+    def get_names(self, kind) -> Optional[Dict[int, str]]:
+        client = self._get_redis_client()
+
+        return self._result(client.get(self.KEYS['names'].format(kind=kind)),
+                            lambda names: dict((int(pk), name) for pk, name in json.loads(names))
+                            if names is not None else None)
+
+    def delete_names(self, *kinds):
+        client = self._get_redis_client()
+
+        return self._result(client.delete(*[self.KEYS['names'].format(kind=kind) for kind in kinds]))
+
+
+class ProfileCacheService(BaseCacheService):
+    PREFIX = 'P'
+    KEYS = {
+        'profile': f'{PREFIX}:''{user_id}_PROFILE',
+    }
+    EX = 60 * 60
+
+    def cache_profile(self, user_id, profile: str):
+        client = self._get_redis_client()
+
+        return self._result(client.set(self.KEYS['profile'].format(user_id=user_id), profile, ex=self.EX))
+
+    def get_profile(self, user_id) -> Optional[str]:
+        client = self._get_redis_client()
+
+        return self._result(client.get(self.KEYS['profile'].format(user_id=user_id)),
+                            lambda profile: profile.decode() if profile is not None else None)
+
+    def delete_profile(self, user_id):
+        client = self._get_redis_client()
+
+        return self._result(client.delete(self.KEYS['profile'].format(user_id=user_id)))
+
+    def delete_profiles(self, *user_ids):
+        client = self._get_redis_client()
+
+        return self._result(client.delete(*[self.KEYS['profile'].format(user_id=user_id) for user_id in user_ids]))
+
+
+class AsyncProfileCacheService(AsyncBaseCacheService, ProfileCacheService):
+    """`ProfileCacheService` for the bot's handlers, every method is awaited outside a batch."""
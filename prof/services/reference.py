@@ -0,0 +1,56 @@
+from _helpers import LocalCache
+from django.conf import settings
+from prof.models import University, Major
+from typing import Dict
+from .cache import ReferenceCacheService
+
+
+class ReferenceService:
+    """Names of universities and majors, read from process memory, then Redis, then the database."""
+    MODELS = {
+        'university': University,
+        'major': Major,
+    }
+    _local = LocalCache(**settings.REFERENCE_CACHE)
+
+    @classmethod
+    def _get_names(cls, kind) -> Dict[int, str]:
+        names = cls._local.get(kind)
+        if names is not None:
+            return names
+
+        cache_service = ReferenceCacheService()
+        names = cache_service.get_names(kind)
+        if names is None:
+            names = dict(cls.MODELS[kind].objects.order_by('id').values_list('id', 'name'))
+            cache_service.cache_names(kind, names)
+
+        cls._local.set(kind, names)
+        return names
+
+    @classmethod
+    def get_universities(cls) -> Dict[int, str]:
+        return cls._get_names('university')
+
+    @classmethod
+    def get_majors(cls) -> Dict[int, str]:
+        return cls._get_names('major')
+
+    @classmethod
+    def get_university_name(cls, university_id) -> str:
+        return cls.get_universities()[int(university_id)]
+
+    @classmethod
+    def get_major_name(cls, major_id) -> str:
+        return cls.get_majors()[int(major_id)]
+
+    @classmethod
+    def invalidate(cls, *kinds):
+        """Drops the given kinds, or every kind, from both tiers.
+
+        Other processes keep their in-memory copy for up to `REFERENCE_CACHE['ttl']` seconds.
+        """
+        kinds = kinds or tuple(cls.MODELS)
+        for kind in kinds:
+            cls._local.delete(kind)
+        ReferenceCacheService().delete_names(*kinds)
@@ -0,0 +1,74 @@
+from _helpers import LocalCache
+from django.conf import settings
+from django.db.models import Sum, Window
+from easy_vahed.models import Course
+from prof.models import Student
+from typing import List, NamedTuple, Optional
+from .name_mapping import NameMappingService
+from .reference import ReferenceService
+
+
+class StudentIdentity(NamedTuple):
+    id: int
+    university_id: int
+    major_id: int
+
+
+class StudentService:
+    """Students by Telegram user id.
+
+    Only what never changes once a student registered is kept in process memory, for
+    `STUDENT_CACHE['ttl']` seconds. Their courses are read from the database on every call.
+    """
+    _local = LocalCache(**settings.STUDENT_CACHE)
+
+    @classmethod
+    def get(cls, user_id) -> Optional[StudentIdentity]:
+        student = cls._local.get(str(user_id))
+        if student is not None:
+            return student
+
+        row = Student.objects.filter(user_id=user_id).values_list('id', 'university_id', 'major_id').first()
+        if row is None:
+            return None
+
+        student = StudentIdentity(*row)
+        cls._local.set(str(user_id), student)
+        return student
+
+    @staticmethod
+    def get_courses(student_id) -> List[Course]:
+        return list(Course.objects.select_related('professor').filter(student__id=student_id).order_by('id'))
+
+    @staticmethod
+    def render_profile(user_id) -> str:
+        """The profile message, from a single query yielding a row per course, with the total weight on every row."""
+        rows = list(Student.objects
+                    .filter(user_id=user_id)
+                    .values('name', 'year', 'university_id', 'major_id',
+                            'courses__name', 'courses__professor__name', 'courses__weight')
+                    .annotate(sum_weight=Window(Sum('courses__weight')))
+                    .order_by('courses__id'))
+        if not rows:
+            raise Student.DoesNotExist(f'No student with user_id {user_id}')
+
+        st = rows[0]
+        name_service: NameMappingService = NameMappingService()
+
+        init_message = settings.TELEGRAM_MESSAGES['profile'].format(
+            name=st['name'],
+            major=name_service.map_major(ReferenceService.get_major_name(st['major_id'])),
+            university=name_service.map_university(ReferenceService.get_university_name(st['university_id'])),
+            year=name_service.map_year(st['year'])
+        )
+        courses_message = '\n'.join([settings.TELEGRAM_MESSAGES['profile_courses'].format(
+            name=row['courses__name'],
+            prof=row['courses__professor__name'],
+            weight=row['courses__weight']
+        ) for row in rows if row['courses__name'] is not None])
+
+        sum_course_weight_message = settings.TELEGRAM_MESSAGES['sum_weight'].format(sum=st['sum_weight'] or 0)
+
+        return f"{init_message}\n---\n" \
+               f"{courses_message}\n---\n" \
+               f"{sum_course_weight_message}"
@@ -0,0 +1,50 @@
+from django.db import transaction
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+from easy_vahed.models import Course
+from prof.models import University, Major, Professor, Student
+from prof.services import ReferenceService, ProfileCacheService
+
+
+def _delete_profiles_on_commit(students):
+    user_ids = list(students.values_list('user_id', flat=True))
+    if user_ids:
+        transaction.on_commit(lambda: ProfileCacheService().delete_profiles(*user_ids))
+
+
+@receiver(post_save, sender=University)
+@receiver(post_delete, sender=University)
+def invalidate_universities(sender, **kwargs):
+    transaction.on_commit(lambda: ReferenceService.invalidate('university'))
+
+
+@receiver(post_save, sender=Major)
+@receiver(post_delete, sender=Major)
+def invalidate_majors(sender, **kwargs):
+    transaction.on_commit(lambda: ReferenceService.invalidate('major'))
+
+
+@receiver(post_save, sender=Course)
+@receiver(pre_delete, sender=Course)
+def delete_course_profiles(sender, instance: Course, **kwargs):
+    # Before a delete, while the course is still linked to its students.
+    _delete_profiles_on_commit(Student.objects.filter(courses=instance))
+
+
+@receiver(post_save, sender=Professor)
+def delete_professor_profiles(sender, instance: Professor, **kwargs):
+    # Deleting a professor deletes their courses, which `delete_course_profiles` handles.
+    _delete_profiles_on_commit(Student.objects.filter(courses__professor=instance).distinct())
+
+
+@receiver(m2m_changed, sender=Student.courses.through)
+def delete_changed_profiles(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('pre_add', 'pre_remove', 'pre_clear'):
+        return
+
+    if not reverse:
+        _delete_profiles_on_commit(Student.objects.filter(pk=instance.pk))
+    elif action == 'pre_clear':
+        _delete_profiles_on_commit(Student.objects.filter(courses=instance))
+    else:
+        _delete_profiles_on_commit(Student.objects.filter(pk__in=pk_set))
@@ -13,4 +13,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'uniar_bot.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up, the bot's modules use the ORM.
+from uniar_bot.webhook import TelegramWebhook  # noqa: E402
+
+application = TelegramWebhook(django_application)
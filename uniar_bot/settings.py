@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -78,9 +79,28 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Kept open by the bot's database threads and Celery workers instead of reconnecting per task
+        'CONN_MAX_AGE': 60 * 10,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Seconds a write waits for the lock held by another process before failing
+            'timeout': 20,
+        },
     }
 }
 
+# Set on every new SQLite connection. WAL lets the bot and Celery read while one of them writes
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'temp_store': 'memory',
+    'cache_size': -16 * 1024,
+    'mmap_size': 64 * 1024 * 1024,
+}
+
+# Threads running the bot's database work, see `_helpers.run_in_database_thread`
+DATABASE_WORKERS = 8
+
 CACHES = {
     "default": {
         "BACKEND": "django_redis.cache.RedisCache",
@@ -92,6 +112,10 @@ CACHES = {
     }
 }
 
+# Where the cache services keep their keys: 'redis' for the default cache's Redis, or 'local'
+# for the process' memory, only for deployments running everything in a single process
+CACHE_SERVICE_BACKEND = 'redis'
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -155,6 +179,7 @@ TELEGRAM_MESSAGES = {
                       'تعداد *واحد* انتخاب شده: *{weight}*',
     'has_conflict': 'درس {c1} با درس {c2} به دلیل {reason} تداخل دارد!',
     'courses_solution': 'اگه درس *{c}* رو حذف کنی می‌تونی این انتخاب‌هارو داشته باشی...',
+    'courses_solution_item': '{courses} (*{weight}* واحد)',
     'has_not_conflict': 'همه‌چی اوکیه! بردار عشق کن ;)',
     'wanna_add_to_profile': 'می‌خوای اینا به پروفایلت اضافه بشه؟',
     'added_to_profile': 'اضافه شد!',
@@ -189,3 +214,51 @@ STATES = {
     'easy_deadline_month': 12,
     'easy_deadline_day': 13,
 }
+
+# Number of courses shown on each page of the choose courses keyboard
+CHOOSE_COURSES_PAGE_SIZE = 15
+
+# Timetable solver used to suggest conflict-free selections
+COURSE_SOLVER = {
+    'max_weight': 20,
+    'top_k': 3,
+    'time_budget': .5,
+}
+
+# In-process tier in front of Redis for university and major names
+REFERENCE_CACHE = {
+    'max_size': 16,
+    'ttl': 60 * 5,
+}
+
+# In-process cache of the ids, university and major of students, per Telegram user id
+STUDENT_CACHE = {
+    'max_size': 1024,
+    'ttl': 30,
+}
+
+# Opt-in counters of cache commands per key family, see the cache_stats command
+CACHE_STATS = {
+    'enabled': False,
+    'flush_interval': 10,
+}
+
+# Updates processed at the same time, those of a single user are still processed one by one
+BOT_CONCURRENT_UPDATES = 32
+
+# The bot's user data in Redis: seconds between periodic persistence runs (a user's data is also written
+# after each of their updates), seconds it is kept after the user's last write, and seconds a process
+# may hold a user's lock before another one can take over their updates
+BOT_PERSISTENCE = {
+    'update_interval': 60,
+    'user_data_ttl': 60 * 60 * 24 * 30,
+    'lock_ttl': 30,
+}
+
+# Webhook mode, served by `uniar_bot.asgi`. Telegram is pointed at `url` on startup when it is set,
+# and updates not carrying `secret_token` in the X-Telegram-Bot-Api-Secret-Token header are refused
+TELEGRAM_WEBHOOK = {
+    'path': '/telegram/webhook/',
+    'url': os.environ.get('TELEGRAM_WEBHOOK_URL'),
+    'secret_token': os.environ.get('TELEGRAM_WEBHOOK_SECRET_TOKEN'),
+}
@@ -0,0 +1,115 @@
+import asyncio
+from unittest import mock
+from asgiref.testing import ApplicationCommunicator
+from django.test import SimpleTestCase, override_settings
+from telegram import Bot, Chat, Message, Update, User
+from telegram.ext import ApplicationHandlerStop, TypeHandler
+from _helpers.local_redis import LocalRedis
+from .webhook import TelegramWebhook
+
+SECRET_TOKEN = 'secret'
+
+
+@mock.patch.object(Bot, 'get_me', mock.AsyncMock(return_value=User(1, 'bot', True, username='bot')))
+@override_settings(CACHE_SERVICE_BACKEND='local',
+                   TELEGRAM_WEBHOOK={'path': '/telegram/webhook/', 'url': None, 'secret_token': SECRET_TOKEN})
+class TelegramWebhookTest(SimpleTestCase):
+
+    def setUp(self):
+        LocalRedis._instance = None
+        self.updates = []
+        self.passed = []
+        self.webhook = TelegramWebhook(self._app)
+
+    def tearDown(self):
+        LocalRedis._instance = None
+
+    async def _app(self, scope, receive, send):
+        self.passed.append(scope['path'])
+        await send({'type': 'http.response.start', 'status': 204, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def _record(self, update, context):
+        # Keeps the bot's own handlers, which answer through the Bot API, out of it
+        self.updates.append(update)
+        raise ApplicationHandlerStop
+
+    async def _lifespan(self, event):
+        communicator = self.communicators.setdefault('lifespan', ApplicationCommunicator(self.webhook,
+                                                                                         {'type': 'lifespan'}))
+        await communicator.send_input({'type': f'lifespan.{event}'})
+        message = await communicator.receive_output(timeout=5)
+        if event == 'startup' and self.webhook.application is not None:
+            self.webhook.application.add_handler(TypeHandler(Update, self._record), group=-1)
+        return message['type']
+
+    async def _request(self, body=b'', method='POST', path='/telegram/webhook/', secret_token=SECRET_TOKEN):
+        headers = [(b'content-type', b'application/json')]
+        if secret_token is not None:
+            headers.append((TelegramWebhook.SECRET_TOKEN_HEADER, secret_token.encode()))
+        communicator = ApplicationCommunicator(self.webhook, {'type': 'http', 'method': method, 'path': path,
+                                                              'headers': headers})
+        await communicator.send_input({'type': 'http.request', 'body': body})
+        start = await communicator.receive_output(timeout=5)
+        await communicator.receive_output(timeout=5)
+        await communicator.wait()
+        return start['status']
+
+    def _serve(self, *requests):
+        """Statuses of `requests` sent between the lifespan startup and shutdown, and the lifespan events."""
+
+        async def serve():
+            self.communicators = {}
+            started = await self._lifespan('startup')
+            statuses = [await self._request(**request) for request in requests]
+            await asyncio.wait_for(self.webhook.application.update_queue.join(), 5)
+            stopped = await self._lifespan('shutdown')
+            return statuses, (started, stopped)
+
+        return asyncio.run(serve())
+
+    @staticmethod
+    def _update(update_id=1):
+        return Update(update_id, message=Message(update_id, None, Chat(7, 'private'),
+                                                 from_user=User(7, 'user', False), text='hi')).to_json().encode()
+
+    def test_lifespan_starts_and_stops_the_bot(self):
+        statuses, events = self._serve()
+
+        self.assertEqual((statuses, events), ([], ('lifespan.startup.complete', 'lifespan.shutdown.complete')))
+        self.assertIsNone(self.webhook.application)
+
+    @mock.patch.object(Bot, 'set_webhook', new_callable=mock.AsyncMock)
+    def test_startup_sets_the_webhook_url(self, set_webhook):
+        with self.settings(TELEGRAM_WEBHOOK={'path': '/telegram/webhook/', 'url': 'https://example.com/hook/',
+                                             'secret_token': SECRET_TOKEN}):
+            self._serve()
+
+        set_webhook.assert_awaited_once_with('https://example.com/hook/', secret_token=SECRET_TOKEN)
+
+    def test_valid_update_is_queued(self):
+        statuses, _ = self._serve({'body': self._update(1)}, {'body': self._update(2)})
+
+        self.assertEqual(statuses, [200, 200])
+        self.assertEqual([(update.update_id, update.effective_user.id, update.message.text)
+                          for update in self.updates], [(1, 7, 'hi'), (2, 7, 'hi')])
+
+    def test_wrong_secret_token_is_forbidden(self):
+        statuses, _ = self._serve({'body': self._update(), 'secret_token': 'wrong'},
+                                  {'body': self._update(), 'secret_token': None})
+
+        self.assertEqual(statuses, [403, 403])
+        self.assertEqual(self.updates, [])
+
+    def test_bad_requests(self):
+        statuses, _ = self._serve({'method': 'GET'}, {'body': b'{not json'}, {'body': b'[]'},
+                                  {'body': b'{}'}, {'body': b'{"message": {}}'})
+
+        self.assertEqual(statuses, [405, 400, 400, 400, 400])
+        self.assertEqual(self.updates, [])
+
+    def test_other_paths_go_to_the_app(self):
+        statuses, _ = self._serve({'method': 'GET', 'path': '/admin/'}, {'path': '/telegram/'})
+
+        self.assertEqual(statuses, [204, 204])
+        self.assertEqual(self.passed, ['/admin/', '/telegram/'])
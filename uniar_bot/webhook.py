@@ -0,0 +1,108 @@
+import asyncio
+import hmac
+import json
+import logging
+from django.conf import settings
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+
+class TelegramWebhook:
+    """ASGI app receiving Telegram updates on `TELEGRAM_WEBHOOK['path']` and passing anything else to `app`.
+
+    The bot's application is started and stopped with the lifespan of the server, or on the first
+    update for servers without lifespan events. Updates are put on its update queue and answered
+    with 200 right away.
+    """
+    SECRET_TOKEN_HEADER = b'x-telegram-bot-api-secret-token'
+
+    def __init__(self, app):
+        self.app = app
+        self.application = None
+        self._startup_lock = asyncio.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+
+        if scope['type'] == 'http' and scope['path'] == settings.TELEGRAM_WEBHOOK['path']:
+            return await self._webhook(scope, receive, send)
+
+        return await self.app(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self._startup()
+                except Exception as e:
+                    logger.exception('Could not start the bot')
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self._shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _startup(self):
+        from bot import build_application
+
+        async with self._startup_lock:
+            if self.application is not None:
+                return
+
+            application = build_application()
+            await application.initialize()
+            await application.start()
+            self.application = application
+
+            if settings.TELEGRAM_WEBHOOK['url']:
+                await application.bot.set_webhook(settings.TELEGRAM_WEBHOOK['url'],
+                                                  secret_token=settings.TELEGRAM_WEBHOOK['secret_token'])
+
+    async def _shutdown(self):
+        if self.application is None:
+            return
+
+        await self.application.stop()
+        await self.application.shutdown()
+        self.application = None
+
+    async def _webhook(self, scope, receive, send):
+        if scope['method'] != 'POST':
+            return await self._respond(send, 405)
+
+        secret_token = settings.TELEGRAM_WEBHOOK['secret_token']
+        if secret_token and not hmac.compare_digest(dict(scope['headers']).get(self.SECRET_TOKEN_HEADER, b''),
+                                                    secret_token.encode()):
+            return await self._respond(send, 403)
+
+        if self.application is None:
+            await self._startup()
+
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except (ValueError, TypeError, KeyError):
+            update = None
+        # `de_json` returns None for an empty body like `{}`
+        if update is None:
+            return await self._respond(send, 400)
+
+        await self.application.update_queue.put(update)
+        return await self._respond(send, 200)
+
+    @staticmethod
+    async def _respond(send, status):
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+        await send({'type': 'http.response.body', 'body': b''})